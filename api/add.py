@@ -3,7 +3,7 @@ import errno
 import ipaddress
 import random
 import sys
-from typing import Any, Dict, List, Optional, Set
+from typing import List, Optional, Set
 from . import common
 import argparse
 
@@ -17,21 +17,41 @@ def vw_add(args: argparse.Namespace) -> int:
     network = config.network()
     nodes = config.nodes()
     blacklist = config.blacklist()
-    config.save()
 
     return_value = 0
 
+    new_node_names: List[str] = []
+    reserved: Set[str] = set()
     for node_name in args.nodes:
-        if node_name in nodes:
+        if node_name in nodes or node_name in reserved:
             print("vwgen: Network '{}' already has node '{}'".format(
                 network_name, node_name),
                   file=sys.stderr)
             return_value = return_value or errno.EEXIST
             continue
-
-        node: Dict[str, Any] = common.SortedDict()
+        new_node_names.append(node_name)
+        reserved.add(node_name)
+    new_node_names += generate_node_names(nodes, getattr(args, 'prefix', ''),
+                                          getattr(args, 'count', 0), reserved)
+
+    # Check both pools up front so a bulk add is all or nothing
+    ipv4_allocator = config.ipv4_allocator()
+    if ipv4_allocator is not None and ipv4_allocator.available() < len(
+            new_node_names):
+        print('vwgen: IPv4 address pool is full')
+        config.close()
+        return errno.ENOSPC
+    if config.ipv4ll_allocator().available() < len(new_node_names):
+        print('vwgen: Link-layer address pool is full')
+        config.close()
+        return errno.ENOSPC
+
+    secrets = common.genkeys(len(new_node_names))
+
+    for node_name, secret in zip(new_node_names, secrets):
+        node = common.Node()
         if 'AddressPoolIPv4' in network:
-            ipv4 = generate_random_ipv4(network, nodes)
+            ipv4 = generate_random_ipv4(config)
             if ipv4 is None:
                 print('vwgen: IPv4 address pool is full')
                 break
@@ -39,9 +59,10 @@ def vw_add(args: argparse.Namespace) -> int:
         else:
             node['Address'] = []
 
-        ipv4ll = generate_random_ipv4ll(nodes)
+        ipv4ll = generate_random_ipv4ll(config)
         if ipv4ll is None:
             print('vwgen: Link-layer address pool is full')
+            config.release_node_addresses(node)
             break
 
         node['AllowedIPs'] = [ipv4ll + '/32']
@@ -50,7 +71,7 @@ def vw_add(args: argparse.Namespace) -> int:
         node['LinkLayerAddress'] = [ipv4ll + '/16']
         node['ListenPort'] = random.randint(32768, 60999)
         node['PersistentKeepalive'] = 0
-        node['PrivateKey'] = binascii.b2a_base64(common.genkey(),
+        node['PrivateKey'] = binascii.b2a_base64(secret,
                                                  newline=False).decode('ascii')
         node['SaveConfig'] = False
         node['UPnP'] = False
@@ -67,58 +88,37 @@ def vw_add(args: argparse.Namespace) -> int:
     return return_value
 
 
-def generate_random_ipv4(network: common.Config.NetworkType,
-                         nodes: common.Config.NodesType) -> Optional[str]:
+def generate_node_names(nodes: common.Config.NodesType, prefix: str,
+                        count: int, reserved: Set[str]) -> List[str]:
 
-    address_pool = ipaddress.IPv4Network(network['AddressPoolIPv4'],
-                                         strict=False)
+    node_names: List[str] = []
+    index = 0
+    while len(node_names) < count:
+        index += 1
+        node_name = '{}{}'.format(prefix, index)
+        if node_name not in nodes and node_name not in reserved:
+            node_names.append(node_name)
+    return node_names
 
-    if address_pool.prefixlen < 31:
-        num_hosts = address_pool.num_addresses - 2
-    else:
-        num_hosts = address_pool.num_addresses
 
-    existing_addresses: Set[str] = set((str(j).split('/', 1)[0]
-                                        for i in nodes.values()
-                                        for j in i.get('Address', [])))
+def generate_random_ipv4(config: common.Config) -> Optional[str]:
 
-    if len(existing_addresses) == num_hosts:
+    allocator = config.ipv4_allocator()
+    if allocator is None:
         return None
 
-    while True:
-
-        if address_pool.prefixlen >= 32:
-            host = 0
-        elif address_pool.prefixlen == 31:
-            host = random.randint(0, 1)
-        else:
-            host = random.randint(1,
-                                  (0xffffffff >> address_pool.prefixlen) - 1)
-
-        ipv4 = ipaddress.IPv4Address(int(address_pool.network_address)
-                                     | host).compressed
-
-        if ipv4 not in existing_addresses:
-            break
-
-    return ipv4 + '/' + str(address_pool.prefixlen)
+    host = allocator.allocate()
+    if host is None:
+        return None
 
+    return ipaddress.IPv4Address(host).compressed + '/' + str(
+        allocator.prefixlen)
 
-def generate_random_ipv4ll(nodes: common.Config.NodesType) -> Optional[str]:
 
-    existing_addresses: Set[str] = set(
-        (str(j).split('/', 1)[0] for i in nodes.values()
-         for j in i.get('LinkLayerAddress', [])))
+def generate_random_ipv4ll(config: common.Config) -> Optional[str]:
 
-    if len(existing_addresses) >= 0xa9feff00 - 0xa9fe0100:
+    host = config.ipv4ll_allocator().allocate()
+    if host is None:
         return None
 
-    while True:
-
-        ipv4ll = ipaddress.IPv4Address(random.randint(0xa9fe0100,
-                                                      0xa9fefeff)).compressed
-
-        if ipv4ll not in existing_addresses:
-            break
-
-    return ipv4ll
+    return ipaddress.IPv4Address(host).compressed
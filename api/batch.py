@@ -1,18 +1,82 @@
-from typing import List
+import shlex
+import sys
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
 
-def load(batch_name: str) -> list or bool:
-    command_list: list(str) = []
+
+def open_batch(batch_name: str) -> Optional[TextIO]:
+    # '-' reads the commands from stdin as they arrive
+    if batch_name == '-':
+        return sys.stdin
     try:
-        batch_file = open(batch_name, 'r')
+        return open(batch_name, 'r')
     except FileNotFoundError:
+        return None
+
+
+def iter_lines(batch_file: TextIO) -> Iterator[str]:
+    # Yields every non-empty line as soon as it has been read
+    for sentence in batch_file:
+        sentence = sentence.strip()
+        if sentence:
+            yield sentence
+
+
+def split(sentence: str) -> List[str]:
+    # Shell-style tokenization, so quoted arguments may contain spaces and
+    # '#' starts a comment
+    return shlex.split(sentence, comments=True)
+
+
+def load(batch_name: str) -> list or bool:
+    batch_file = open_batch(batch_name)
+    if batch_file is None:
         return False
-    else:
-        # batch_file_content :str = batch_file.readlines
-        for sentence in batch_file.readlines():
-            if sentence.split('\n')[0]:
-                command_list.append(sentence.split('\n')[0].strip())
+    try:
+        return list(iter_lines(batch_file))
+    finally:
+        if batch_file is not sys.stdin:
+            batch_file.close()
+
+
+def interfaces(sentence: str) -> List[str]:
+    # The -i/--interface values of a batch line, without a full parse
+    names: List[str] = []
+    try:
+        tokens = split(sentence)
+    except ValueError:
+        tokens = sentence.split()
+    for index, token in enumerate(tokens):
+        if token in ('-i', '--interface') and index + 1 < len(tokens):
+            names.append(tokens[index + 1])
+        elif token.startswith('--interface='):
+            names.append(token[len('--interface='):])
+        elif token.startswith('-i') and len(token) > 2:
+            names.append(token[2:])
+    return names
+
 
-    return command_list
+def partition(command_list: List[str]) -> List[List[Tuple[int, str]]]:
+    # Split the batch into groups of (line index, line) that share no
+    # interface, keeping the order of lines within each group. Groups are
+    # ordered by their first line. Lines naming no interface form one group.
+    parent: Dict[str, str] = {}
 
+    def find(name: str) -> str:
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
 
+    line_names = []
+    for sentence in command_list:
+        names = interfaces(sentence) or ['']
+        for name in names:
+            parent.setdefault(name, name)
+        for name in names[1:]:
+            parent[find(name)] = find(names[0])
+        line_names.append(names[0])
 
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    for index, (sentence, name) in enumerate(zip(command_list, line_names)):
+        groups.setdefault(find(name), []).append((index, sentence))
+    return list(groups.values())
@@ -0,0 +1,40 @@
+import errno
+import json
+import os
+import socket
+import sys
+from typing import List
+
+# Thin client of `vwgen serve`, see api/serve.py for the wire format. It
+# imports nothing beyond the standard library so forwarding stays cheap.
+
+
+def vw_connect(socket_path: str, argv: List[str]) -> int:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        print("vwgen: Unable to connect to '{}': {}".format(
+            socket_path, e.strerror),
+              file=sys.stderr)
+        sock.close()
+        return e.errno or errno.ECONNREFUSED
+
+    with sock, sock.makefile('rb') as rfile:
+        request = {'argv': argv, 'cwd': os.getcwd()}
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        for line in rfile:
+            message = json.loads(line.decode('utf-8'))
+            if 'out' in message:
+                sys.stdout.write(message['out'])
+                sys.stdout.flush()
+            elif 'err' in message:
+                sys.stderr.write(message['err'])
+                sys.stderr.flush()
+            elif 'stdin' in message:
+                data = {'stdin': sys.stdin.read()}
+                sock.sendall((json.dumps(data) + '\n').encode('utf-8'))
+            elif 'exit' in message:
+                return int(message['exit'])
+    print('vwgen: Connection to the server was lost', file=sys.stderr)
+    return errno.ECONNRESET
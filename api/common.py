@@ -1,14 +1,19 @@
 import binascii
+import bisect
 import collections
 import errno
 import fcntl
+import hashlib
 import ipaddress
-import nacl.bindings
+import json
+import os
 import random
+import re
+import socket
 import sys
-import toml
-from typing import Any, cast, Dict, KeysView, ItemsView, Iterator, List, Optional, Set, TextIO, TypeVar, ValuesView
+from typing import Any, Callable, cast, Dict, Iterable, KeysView, ItemsView, Iterator, List, Mapping, MutableMapping, Optional, Set, TextIO, Tuple, TypeVar, Union, ValuesView
 import pickle
+from .profiling import profiler
 
 T = TypeVar('T')
 KT = TypeVar('KT')
@@ -37,20 +42,77 @@ class FakeList(List[T], metaclass=_FakeListMeta):
 
 
 class SortedDict(Dict[KT, VT]):
+    # Sorted views are cached until the next mutation. Class level defaults
+    # keep __setitem__ working while pickle restores items before __dict__.
+    _sorted_keys: Optional[List[KT]] = None
+    _sorted_items: Optional[List[Any]] = None
+
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
 
+    def __getstate__(self) -> None:
+        # The sorted views are rebuilt on demand, do not pickle them
+        return None
+
+    def _sorted_keys_cache(self) -> List[KT]:
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(super().keys())
+        return self._sorted_keys
+
+    def _invalidate(self) -> None:
+        self._sorted_keys = None
+        self._sorted_items = None
+
     def keys(self) -> KeysView[KT]:
-        return cast(KeysView[KT], sorted(super().keys()))
+        return cast(KeysView[KT], list(self._sorted_keys_cache()))
 
     def values(self) -> ValuesView[VT]:
         return super().values()
 
     def items(self) -> ItemsView[KT, VT]:
-        return cast(ItemsView[KT, VT], sorted(super().items()))
+        if self._sorted_items is None:
+            self._sorted_items = [(k, super(SortedDict, self).__getitem__(k))
+                                  for k in self._sorted_keys_cache()]
+        return cast(ItemsView[KT, VT], list(self._sorted_items))
 
     def __iter__(self) -> Iterator[KT]:
-        return iter(self.keys())
+        # The cached list is replaced, never modified, so the dict may change
+        # while this iterator is alive
+        return iter(self._sorted_keys_cache())
+
+    def __setitem__(self, key: KT, value: VT) -> None:
+        if key not in self:
+            self._sorted_keys = None
+        self._sorted_items = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: KT) -> None:
+        super().__delitem__(key)
+        self._invalidate()
+
+    def pop(self, *args: Any) -> Any:
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self) -> Any:
+        self._invalidate()
+        return super().popitem()
+
+    def setdefault(self, *args: Any) -> Any:
+        self._invalidate()
+        return super().setdefault(*args)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        self._invalidate()
+        super().update(*args, **kwargs)
+
+    def clear(self) -> None:
+        self._invalidate()
+        super().clear()
+
+    def __ior__(self, other: Any) -> 'SortedDict[KT, VT]':
+        self._invalidate()
+        return cast(SortedDict[KT, VT], super().__ior__(other))
 
     def __repr__(self) -> str:
         return '{' + ', '.join(
@@ -60,61 +122,400 @@ class SortedDict(Dict[KT, VT]):
         return repr(self)
 
 
-class SortedSet(FakeList[T]):
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        self._set: Set[T] = set(*args, **kwargs)
-        self._sorted: bool = False
-        super().__init__()
+class NamePair(FakeList[str]):
+    def __init__(self, name1: str, name2: str) -> None:
+        super().__init__((name1, name2))
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
 
-    def add(self, item: T) -> None:
-        self._set.add(item)
-        # Add a new item
+class Blacklist(FakeList[NamePair]):
+    # Directed (node, peer) pairs indexed per node in both directions, so
+    # membership is O(1) and removing a node is O(degree). It still
+    # serializes as the list of pairs stored in [PeerBlacklist]. Once that
+    # list is sorted, single adds and removes are bisected into it.
+    def __init__(self, pairs: Iterable[Any] = ()) -> None:
+        self._peers: Dict[str, Set[str]] = {}
+        # node -> peers it has blacklisted
+        self._blocked_by: Dict[str, Set[str]] = {}
+        # node -> nodes that have blacklisted it
+        self._len = 0
         self._sorted = False
-        #  set sort state is false
+        super().__init__()
+        for name1, name2 in pairs:
+            self.add(NamePair(name1, name2))
+
+    def add(self, item: NamePair) -> None:
+        name1, name2 = item
+        peers = self._peers.setdefault(name1, set())
+        if name2 in peers:
+            return
+        peers.add(name2)
+        self._blocked_by.setdefault(name2, set()).add(name1)
+        self._len += 1
+        if self._sorted:
+            # __len__ already counts the new pair, pass the list bounds
+            bisect.insort(self, NamePair(name1, name2), 0,
+                          super().__len__())
+
+    def remove(self, item: NamePair) -> None:
+        name1, name2 = item
+        peers = self._peers.get(name1)
+        if peers is None or name2 not in peers:
+            raise KeyError(item)
+        self._discard(name1, name2)
+        if self._sorted:
+            del self[bisect.bisect_left(self, NamePair(name1, name2), 0,
+                                        super().__len__())]
 
-    def remove(self, item: T) -> None:
-        self._set.remove(item)
-        # remove a item
+    def remove_node(self, name: str) -> None:
+        for peer in list(self._peers.get(name, ())):
+            self._discard(name, peer)
+        for peer in list(self._blocked_by.get(name, ())):
+            self._discard(peer, name)
         self._sorted = False
-        #  set sort state is false
+
+    def peers(self, name: str) -> Set[str]:
+        return set(self._peers.get(name, ()))
 
     def sort(self, **kwargs: Any) -> None:
         if not self._sorted:
-            super().__init__(self._set)
-            super().sort(**kwargs)
+            super().__init__(
+                NamePair(name1, name2) for name1 in sorted(self._peers)
+                for name2 in sorted(self._peers[name1]))
             self._sorted = True
 
+    def _discard(self, name1: str, name2: str) -> None:
+        self._peers[name1].discard(name2)
+        if not self._peers[name1]:
+            del self._peers[name1]
+        self._blocked_by[name2].discard(name1)
+        if not self._blocked_by[name2]:
+            del self._blocked_by[name2]
+        self._len -= 1
+
     def __contains__(self, key: Any) -> bool:
-        return key in self._set
+        try:
+            name1, name2 = key
+        except (TypeError, ValueError):
+            return False
+        return name2 in self._peers.get(name1, ())
+
+    def __getitem__(self, index: Any) -> Any:
+        self.sort()
+        return super().__getitem__(index)
 
-    def __iter__(self) -> Iterator[T]:
+    def __iter__(self) -> Iterator[NamePair]:
         self.sort()
         return super().__iter__()
 
     def __len__(self) -> int:
-        return len(self._set)
+        return self._len
 
     def __repr__(self) -> str:
-        return '{' + ', '.join((repr(i) for i in self)) + '}'
+        return '[' + ', '.join((repr(i) for i in self)) + ']'
 
     def __str__(self) -> str:
         return repr(self)
 
 
-class NamePair(FakeList[str]):
-    def __init__(self, name1: str, name2: str) -> None:
-        super().__init__((name1, name2))
+# (version, address, prefix length or None) of one address field entry
+AddressType = Tuple[int, int, Optional[int]]
+
+_ADDRESS_FIELDS = frozenset(('Address', 'AllowedIPs', 'LinkLayerAddress'))
+_NODE_FIELDS = ('Address', 'AllowedIPs', 'Endpoint', 'FwMark',
+                'LinkLayerAddress', 'ListenPort', 'PersistentKeepalive',
+                'PostDown', 'PostUp', 'PreDown', 'PreUp', 'PrivateKey',
+                'SaveConfig', 'UPnP')
+_NODE_SLOTS = {field: '_' + field for field in _NODE_FIELDS}
+_MISSING = object()
+
+
+class Node(MutableMapping[str, Any]):
+    # One [Node.<name>] table, a mapping with the keys and values of the
+    # TOML layout. Address fields are kept as tuples of pack_address()
+    # ints and the private key as its 32 raw bytes; their TOML values are
+    # rebuilt on every access. Arrays of every field read back as tuples,
+    # so a changed array has to be assigned back to its field.
+    # Unknown fields, and values that would not come back exactly as they
+    # were set, are kept in _extra. TOML has no None, setting a field to
+    # None removes it, as a save and load would. items() keeps its
+    # formatted result until the next change, as SortedDict does.
+    __slots__ = tuple(_NODE_SLOTS.values()) + ('_extra', '_items')
+
+    def __init__(self, table: Optional[Mapping[str, Any]] = None) -> None:
+        self._extra: Optional[Dict[str, Any]] = None
+        self._items: Optional[List[Tuple[str, Any]]] = None
+        if table is not None:
+            for key, value in table.items():
+                self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        slot = _NODE_SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot, _MISSING)
+            if value is not _MISSING:
+                decode = _NODE_DECODERS.get(key)
+                return value if decode is None else decode(value)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._items = None
+        if value is None:
+            if key in self:
+                del self[key]
+            return
+        if type(value) is list or type(value) is tuple:
+            value = _frozen_array(value)
+        slot = _NODE_SLOTS.get(key)
+        if slot is not None:
+            packed = _pack_node_field(key, value)
+            if packed is not _MISSING:
+                setattr(self, slot, packed)
+                if self._extra is not None and key in self._extra:
+                    self._discard_extra(key)
+                return
+            if hasattr(self, slot):
+                delattr(self, slot)
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        self._items = None
+        slot = _NODE_SLOTS.get(key)
+        if slot is not None and hasattr(self, slot):
+            delattr(self, slot)
+        elif self._extra is not None and key in self._extra:
+            self._discard_extra(key)
+        else:
+            raise KeyError(key)
+
+    def _discard_extra(self, key: str) -> None:
+        assert self._extra is not None
+        del self._extra[key]
+        if not self._extra:
+            self._extra = None
+
+    def __contains__(self, key: Any) -> bool:
+        slot = _NODE_SLOTS.get(key)
+        if slot is not None and hasattr(self, slot):
+            return True
+        return self._extra is not None and key in self._extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        slot = _NODE_SLOTS.get(key)
+        if slot is not None:
+            value = getattr(self, slot, _MISSING)
+            if value is not _MISSING:
+                decode = _NODE_DECODERS.get(key)
+                return value if decode is None else decode(value)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def items(self) -> List[Tuple[str, Any]]:  # type: ignore
+        if self._items is not None:
+            return list(self._items)
+        result = []
+        for field, slot, decode in _NODE_LAYOUT:
+            value = getattr(self, slot, _MISSING)
+            if value is not _MISSING:
+                result.append(
+                    (field, value if decode is None else decode(value)))
+        if self._extra is not None:
+            result = sorted(result + list(self._extra.items()),
+                            key=lambda i: i[0])
+        self._items = result
+        return list(result)
+
+    def __iter__(self) -> Iterator[str]:
+        # Sorted, like a SortedDict
+        keys = [
+            field for field in _NODE_FIELDS
+            if hasattr(self, _NODE_SLOTS[field])
+        ]
+        if self._extra is not None:
+            keys = sorted(keys + list(self._extra))
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return sum(1 for slot in _NODE_SLOTS.values()
+                   if hasattr(self, slot)) + len(self._extra or ())
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        # Ellipsis marks an unset field, it is never a TOML value
+        return tuple(
+            getattr(self, slot, ...)
+            for slot in _NODE_SLOTS.values()) + (self._extra, )
+
+    def __setstate__(self, state: Tuple[Any, ...]) -> None:
+        for slot, value in zip(_NODE_SLOTS.values(), state):
+            if value is not ...:
+                setattr(self, slot, value)
+        self._extra = state[-1]
+        self._items = None
+
+    def __repr__(self) -> str:
+        return '{' + ', '.join(
+            (repr(k) + ': ' + repr(v) for k, v in self.items())) + '}'
+
+    def __str__(self) -> str:
+        return repr(self)
+
+    def addresses(self, key: str) -> List[Optional[AddressType]]:
+        # One entry per item of an address field, None for an item that is
+        # not an IP address
+        packed = getattr(self, _NODE_SLOTS[key], _MISSING)
+        if packed is not _MISSING:
+            return [unpack_address(i) for i in packed]
+        if self._extra is None or not isinstance(self._extra.get(key),
+                                                 (list, tuple)):
+            return []
+        result: List[Optional[AddressType]] = []
+        for address in self._extra[key]:
+            i = pack_address(address) if isinstance(address, str) else None
+            result.append(None if i is None else unpack_address(i))
+        return result
+
+    def secret(self) -> Optional[bytes]:
+        # The raw private key, None unless it is 32 bytes
+        secret = getattr(self, '_PrivateKey', _MISSING)
+        if secret is not _MISSING:
+            return cast(bytes, secret)
+        if self._extra is None or not isinstance(
+                self._extra.get('PrivateKey'), str):
+            return None
+        try:
+            secret = binascii.a2b_base64(self._extra['PrivateKey'])
+        except binascii.Error:
+            return None
+        return secret if len(secret) == 32 else None
+
+
+def _format_addresses(packed: Tuple[int, ...]) -> Tuple[str, ...]:
+    return tuple([format_packed_address(i) for i in packed])
+
+
+def _frozen_array(value: Union[List[Any], Tuple[Any, ...]]) -> Tuple[Any, ...]:
+    # The tuple a Node keeps for a TOML array, nested arrays included
+    return tuple([
+        _frozen_array(i) if type(i) is list or type(i) is tuple else i
+        for i in value
+    ])
+
+
+def _format_key(secret: bytes) -> str:
+    return binascii.b2a_base64(secret, newline=False).decode('ascii')
+
+
+# TOML value of the fields kept in a compact form
+_NODE_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    'Address': _format_addresses,
+    'AllowedIPs': _format_addresses,
+    'LinkLayerAddress': _format_addresses,
+    'PrivateKey': _format_key,
+}
+_NODE_LAYOUT = tuple((field, _NODE_SLOTS[field], _NODE_DECODERS.get(field))
+                     for field in _NODE_FIELDS)
+
+
+def _pack_node_field(key: str, value: Any) -> Any:
+    # _MISSING when the value has no compact form that gives it back as is
+    if key in _ADDRESS_FIELDS:
+        if type(value) is not tuple:
+            return _MISSING
+        packed: List[int] = []
+        for address in value:
+            if type(address) is not str:
+                return _MISSING
+            i = pack_address(address)
+            if i is None or format_packed_address(i) != address:
+                return _MISSING
+            packed.append(i)
+        return tuple(packed)
+    elif key == 'PrivateKey':
+        if type(value) is not str:
+            return _MISSING
+        try:
+            secret = binascii.a2b_base64(value)
+        except binascii.Error:
+            return _MISSING
+        if len(secret) != 32 or binascii.b2a_base64(
+                secret, newline=False).decode('ascii') != value:
+            return _MISSING
+        return secret
+    return value
+
+
+def parse_address(address: str) -> Optional[Tuple[int, int]]:
+    # (version, address as an integer)
+    for version, family in ((4, socket.AF_INET), (6, socket.AF_INET6)):
+        try:
+            return version, int.from_bytes(socket.inet_pton(family, address),
+                                           'big')
+        except OSError:
+            pass
+    return None
+
+
+def format_address(version: int, address: int) -> str:
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, address.to_bytes(4, 'big'))
+    text = socket.inet_ntop(socket.AF_INET6, address.to_bytes(16, 'big'))
+    if '.' in text:
+        # Same as ipaddress, which never writes IPv6 in dotted form
+        text = ipaddress.IPv6Address(address).compressed
+    return text
+
+
+def pack_address(address: str) -> Optional[int]:
+    # 'address[/prefix]' as (address << 9) | (prefix << 1) | is_ipv6, with
+    # prefix 255 when there is none
+    host, slash, prefix = address.partition('/')
+    parsed = parse_address(host)
+    if parsed is None:
+        return None
+    version, value = parsed
+    prefixlen = 255
+    if slash:
+        if not prefix.isdigit() or int(prefix) > (32 if version == 4 else 128):
+            return None
+        prefixlen = int(prefix)
+    return (value << 9) | (prefixlen << 1) | (version == 6)
 
-    def __hash__(self) -> int:
-        return hash(tuple(self))
+
+def unpack_address(packed: int) -> AddressType:
+    prefixlen: Optional[int] = (packed >> 1) & 0xff
+    return (6 if packed & 1 else 4, packed >> 9,
+            None if prefixlen == 255 else prefixlen)
+
+
+def format_packed_address(packed: int) -> str:
+    # unpack_address() and format_address() in one step, this runs for
+    # every address each time a config is written
+    address = packed >> 9
+    prefixlen = (packed >> 1) & 0xff
+    if packed & 1:
+        text = format_address(6, address)
+        return text if prefixlen == 255 else text + '/' + str(prefixlen)
+    elif prefixlen == 255:
+        return '{}.{}.{}.{}'.format(address >> 24, address >> 16 & 0xff,
+                                    address >> 8 & 0xff, address & 0xff)
+    return '{}.{}.{}.{}/{}'.format(address >> 24, address >> 16 & 0xff,
+                                   address >> 8 & 0xff, address & 0xff,
+                                   prefixlen)
 
 
 class Config():
     # define type hint
     NetworkType = Dict[str, Any]
-    NodeType = Dict[str, Any]
+    NodeType = Node
     NodesType = Dict[str, NodeType]
-    BlacklistType = SortedSet[NamePair]
+    BlacklistType = Blacklist
 
     def __init__(self) -> None:
         self._conf = SortedDict[str, Any]()
@@ -125,6 +526,18 @@ class Config():
         # init str value
         self._writable = False
         # init bool value
+        self._ipv4_allocator: Optional[AddressAllocator] = None
+        self._ipv4ll_allocator: Optional[AddressAllocator] = None
+        # built on first use, kept until the next load
+        self._transaction = False
+        self._dirty = False
+        # save() only marks the config dirty inside a transaction
+        self._empty_conf = False
+        # begin() created the conf file of a new network to lock it
+        self._exists = False
+        self._snapshot_loaded = False
+        self._stat: Optional[Tuple[int, int, int]] = None
+        # identity of the conf file as last loaded or written
 
     def __del__(self) -> None:
         try:
@@ -132,43 +545,170 @@ class Config():
         except Exception:
             pass
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # The open file and its lock stay with this process. A copy made
+        # inside a transaction only changes memory, like the original.
+        state = self.__dict__.copy()
+        state['_conf_file'] = None
+        state['_writable'] = False
+        return state
+
     def load(self, conf_name: str) -> bool:
         if conf_name.endswith('.conf'):
             conf_name = conf_name[:-5]
+        self.invalidate_allocators()
         try:
             self._open_file(conf_name)
         except FileNotFoundError:
             # your network conf init process
             self._conf = SortedDict()
             self._conf_name = conf_name
+            self._exists = False
+            self._stat = None
             return False
         assert self._conf_file is not None
-        self._conf = cast(SortedDict[str, Any],
-                          toml.load(self._conf_file, SortedDict))
-        # decode conf file to json?
+        with profiler.phase('config.read'):
+            self._conf_file.seek(0)
+            raw = self._conf_file.buffer.read()
+            digest = hashlib.blake2b(raw, digest_size=16).digest()
+        with profiler.phase('config.read_snapshot'):
+            conf = self._load_snapshot(conf_name, digest)
+        if conf is None:
+            # toml is only needed when the snapshot is stale
+            with profiler.phase('config.parse_toml'):
+                import toml
+                # decode conf file to json?
+                conf = toml.loads(raw.decode(self._conf_file.encoding),
+                                  SortedDict)
+                if isinstance(conf.get('Node'), dict):
+                    for node_name, table in conf['Node'].items():
+                        if isinstance(table, dict):
+                            conf['Node'][node_name] = Node(table)
+        self._conf = cast(SortedDict[str, Any], conf)
+        if conf is not None and not self._snapshot_loaded:
+            self._save_snapshot(conf_name, digest)
+        with profiler.phase('config.read_pubkey_cache'):
+            pubkey_cache.load(conf_name + '.pubkey')
+        self._exists = True
+        self._record_stat()
         return True
 
-    def conf2str(self) -> bool:
-        assert self._conf is not None
-        if isinstance(self._conf, SortedDict):
-            self._conf2str = self._conf.__str__()
-            return True
-        return False
-
     def save(self) -> None:
         if self._conf is None:
             return
         elif self._conf_name is None:
             return
+        self._exists = True
+        if self._transaction:
+            self._dirty = True
+            return
         self._open_file(self._conf_name, writable=True)
         assert self._conf_file is not None
-        data: str = toml.dumps(self._conf)
         self._conf_file.truncate()
-        self._conf_file.write(data)
+        writer = _HashingWriter(self._conf_file)
+        with profiler.phase('config.write_toml'):
+            dump_toml(self._conf, cast(TextIO, writer))
+            self._conf_file.flush()
+        self._record_stat()
+        self._save_snapshot(self._conf_name, writer.digest())
+        self._save_pubkey_cache()
 
     def close(self) -> None:
+        if self._transaction:
+            return
+        self._save_pubkey_cache()
         self._close_file()
 
+    def begin(self) -> None:
+        # Hold the write lock until commit() or rollback(), so nobody else
+        # changes the file underneath the in-memory state
+        if self._conf_name is None:
+            raise ValueError('Config not loaded')
+        # A new network is locked through an empty conf file, which commit()
+        # or rollback() replace or remove before they let go of the lock
+        self._open_file(self._conf_name, writable=True)
+        assert self._conf_file is not None
+        self._empty_conf = os.fstat(self._conf_file.fileno()).st_size == 0
+        if self._empty_conf:
+            if self._exists:
+                self._conf = SortedDict()
+                self._exists = False
+                self.invalidate_allocators()
+        elif self.changed_on_disk():
+            # Written by someone else after load(), read it under the lock
+            self.load(self._conf_name)
+        self._transaction = True
+        self._dirty = False
+
+    def commit(self) -> None:
+        if not self._transaction:
+            return
+        assert self._conf_name is not None
+        self._transaction = False
+        if self._dirty:
+            self._dirty = False
+            conf_path = self._conf_name + '.conf'
+            try:
+                mode = os.stat(conf_path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o666
+            writers: List[_HashingWriter] = []
+
+            def write_conf(conf_file: TextIO) -> None:
+                writers.append(_HashingWriter(conf_file))
+                dump_toml(self._conf, cast(TextIO, writers[-1]))
+
+            # Replace the file while still holding the lock on the old one
+            with profiler.phase('config.write_toml'):
+                write_atomic(conf_path, write_conf, mode)
+            self._empty_conf = False
+            self._record_stat()
+            self._save_snapshot(self._conf_name, writers[-1].digest())
+        self._remove_empty_conf()
+        self.close()
+
+    def rollback(self) -> None:
+        if not self._transaction:
+            return
+        assert self._conf_name is not None
+        self._transaction = False
+        self._dirty = False
+        self._remove_empty_conf()
+        self.load(self._conf_name)
+        self._close_file()
+
+    def _remove_empty_conf(self) -> None:
+        if not self._empty_conf:
+            return
+        assert self._conf_name is not None
+        self._empty_conf = False
+        os.unlink(self._conf_name + '.conf')
+        # Runs waiting for the lock find the file gone and start over
+        self._close_file()
+
+    def exists(self) -> bool:
+        return self._exists
+
+    def changed_on_disk(self) -> bool:
+        # True when someone else wrote the file since it was last loaded or
+        # saved, so a long lived Config must be loaded again
+        if self._conf_name is None:
+            return True
+        try:
+            st = os.stat(self._conf_name + '.conf')
+        except FileNotFoundError:
+            return self._stat is not None
+        return self._stat != (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _record_stat(self) -> None:
+        assert self._conf_name is not None
+        try:
+            st = os.stat(self._conf_name + '.conf')
+        except FileNotFoundError:
+            self._stat = None
+            return
+        self._stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+
     def network_name(self) -> str:
         if self._conf_name is None:
             raise ValueError('Config not loaded')
@@ -199,17 +739,101 @@ class Config():
 
     def blacklist(self) -> BlacklistType:
         if 'PeerBlacklist' not in self._conf:
-            self._conf['PeerBlacklist'] = {'Blacklist': SortedSet()}
+            self._conf['PeerBlacklist'] = {'Blacklist': Blacklist()}
         elif 'Blacklist' not in self._conf['PeerBlacklist']:
-            self._conf['PeerBlacklist']['Blacklist'] = SortedSet()
+            self._conf['PeerBlacklist']['Blacklist'] = Blacklist()
         elif not isinstance(self._conf['PeerBlacklist']['Blacklist'],
-                            SortedSet):
-            self._conf['PeerBlacklist']['Blacklist'] = SortedSet(
-                (NamePair(i, j)
-                 for i, j in self._conf['PeerBlacklist']['Blacklist']))
+                            Blacklist):
+            self._conf['PeerBlacklist']['Blacklist'] = Blacklist(
+                self._conf['PeerBlacklist']['Blacklist'])
         return cast(Config.BlacklistType,
                     self._conf['PeerBlacklist']['Blacklist'])
 
+    def ipv4_allocator(self) -> Optional['AddressAllocator']:
+        pool = self.network().get('AddressPoolIPv4')
+        if not pool:
+            return None
+        allocator = self._ipv4_allocator
+        if allocator is None or allocator.pool != pool:
+            allocator = AddressAllocator.from_ipv4_pool(pool)
+            allocator.reserve_all((j for i in self.nodes().values()
+                                   for j in i.addresses('Address')))
+            self._ipv4_allocator = allocator
+        return allocator
+
+    def ipv4ll_allocator(self) -> 'AddressAllocator':
+        allocator = self._ipv4ll_allocator
+        if allocator is None:
+            allocator = AddressAllocator.from_ipv4ll()
+            allocator.reserve_all((j for i in self.nodes().values()
+                                   for j in i.addresses('LinkLayerAddress')))
+            self._ipv4ll_allocator = allocator
+        return allocator
+
+    def release_node_addresses(self, node: NodeType) -> None:
+        if self._ipv4_allocator is not None:
+            self._ipv4_allocator.release_all(node.addresses('Address'))
+        if self._ipv4ll_allocator is not None:
+            self._ipv4ll_allocator.release_all(
+                node.addresses('LinkLayerAddress'))
+
+    def invalidate_allocators(self) -> None:
+        self._ipv4_allocator = None
+        self._ipv4ll_allocator = None
+
+    # The parsed config is pickled to <iface>.snapshot. The snapshot is used
+    # only while the mtime, size and hash of <iface>.conf still match, and
+    # only if nobody but the current user can have written it.
+    SNAPSHOT_VERSION = 3
+
+    def _load_snapshot(self, conf_name: str,
+                       digest: bytes) -> Optional[SortedDict[str, Any]]:
+        self._snapshot_loaded = False
+        assert self._conf_file is not None
+        conf_stat = os.fstat(self._conf_file.fileno())
+        try:
+            with open(conf_name + '.snapshot', 'rb') as snapshot_file:
+                if not _is_trusted_file(snapshot_file.fileno()):
+                    return None
+                header = pickle.load(snapshot_file)
+                if header != (Config.SNAPSHOT_VERSION, conf_stat.st_mtime_ns,
+                              conf_stat.st_size, digest):
+                    return None
+                conf = pickle.load(snapshot_file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A broken snapshot only costs a TOML parse
+            return None
+        if not isinstance(conf, SortedDict):
+            return None
+        self._snapshot_loaded = True
+        return conf
+
+    def _save_snapshot(self, conf_name: str, digest: bytes) -> None:
+        with profiler.phase('config.write_snapshot'):
+            self._write_snapshot(conf_name, digest)
+
+    def _write_snapshot(self, conf_name: str, digest: bytes) -> None:
+        try:
+            conf_stat = os.stat(conf_name + '.conf')
+            data = pickle.dumps(
+                (Config.SNAPSHOT_VERSION, conf_stat.st_mtime_ns,
+                 conf_stat.st_size, digest),
+                protocol=pickle.HIGHEST_PROTOCOL) + pickle.dumps(
+                    _toml_normalized(self._conf),
+                    protocol=pickle.HIGHEST_PROTOCOL)
+            write_atomic(conf_name + '.snapshot', data, 0o600)
+        except (OSError, pickle.PicklingError):
+            pass
+
+    def _save_pubkey_cache(self) -> None:
+        # Only networks that exist on disk get a sidecar file
+        if self._conf_name is None or 'Node' not in self._conf:
+            return
+        pubkey_cache.save(self._conf_name + '.pubkey',
+                          cast(Config.NodesType, self._conf['Node']))
+
     def _close_file(self) -> None:
         if self._conf_file is None:
             return
@@ -223,67 +847,485 @@ class Config():
             self._conf_file.seek(0)
             return
         self._close_file()
+        while True:
+            conf_file = self._open_locked_file(conf_name, writable)
+            try:
+                # commit() may have replaced the file while we were waiting
+                # for the lock, in that case lock the new one instead
+                if os.fstat(conf_file.fileno()).st_ino == os.stat(
+                        conf_name + '.conf').st_ino:
+                    break
+            except FileNotFoundError:
+                conf_file.close()
+                if writable:
+                    continue
+                raise
+            conf_file.close()
+        self._conf_file = conf_file
+        self._conf_name = conf_name
+        self._writable = writable
+
+    @staticmethod
+    def _open_locked_file(conf_name: str, writable: bool) -> TextIO:
         if writable:
-            conf_file = open(conf_name + '.conf', 'w+')
+            # Do not truncate before the lock is held
+            conf_file = open(
+                os.open(conf_name + '.conf', os.O_RDWR | os.O_CREAT, 0o666),
+                'r+')
         else:
             conf_file = open(conf_name + '.conf', 'r')
         try:
             # LOCK_UN - 解锁
             # LOCK_SH - 获取共享锁
             # LOCK_EX - 获得互斥锁
-            try:
-                # 避免获得锁的时候产生阻塞
-                if writable:
-                    fcntl.lockf(conf_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
-                else:
-                    fcntl.lockf(conf_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
-            except OSError as e:
-                if e.errno in (errno.EACCES, errno.EAGAIN):
-                    # 如果使用 LOCK_NB 并且无法获取锁定，则会引发 OSError ，并且异常将errno属性设置为 EACCES 或 EAGAIN （取决于操作系统;为了便携性，请检查两个值）。
-                    print(
-                        'The configuration file is being used by another process, waiting.',
-                        end='',
-                        file=sys.stderr,
-                        flush=True)
+            with profiler.phase('lock wait'):
+                try:
+                    # 避免获得锁的时候产生阻塞
                     if writable:
-                        fcntl.lockf(conf_file, fcntl.LOCK_EX)
+                        fcntl.lockf(conf_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
                     else:
-                        fcntl.lockf(conf_file, fcntl.LOCK_SH)
-                    print(file=sys.stderr, flush=True)
-                else:
-                    raise
+                        fcntl.lockf(conf_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except OSError as e:
+                    if e.errno in (errno.EACCES, errno.EAGAIN):
+                        # 如果使用 LOCK_NB 并且无法获取锁定，则会引发 OSError ，并且异常将errno属性设置为 EACCES 或 EAGAIN （取决于操作系统;为了便携性，请检查两个值）。
+                        print(
+                            'The configuration file is being used by another process, waiting.',
+                            end='',
+                            file=sys.stderr,
+                            flush=True)
+                        if writable:
+                            fcntl.lockf(conf_file, fcntl.LOCK_EX)
+                        else:
+                            fcntl.lockf(conf_file, fcntl.LOCK_SH)
+                        print(file=sys.stderr, flush=True)
+                        profiler.count('lock contended')
+                    else:
+                        raise
         except Exception as e:
             conf_file.close()
             raise
-        self._conf_file = conf_file
-        self._conf_name = conf_name
-        self._writable = writable
+        return conf_file
+
+
+class AddressAllocator():
+    # Bitmap of the IPv4 addresses in [first, first + count)
+    PROBES = 16
+    # Random picks tried before falling back to a scan for a free slot
+    _FREE_BYTE = re.compile(b'[^\xff]')
+
+    def __init__(self, pool: str, prefixlen: int, first: int,
+                 count: int) -> None:
+        self.pool = pool
+        self.prefixlen = prefixlen
+        self._first = first
+        self._count = count
+        self._used = 0
+        self._bitmap = bytearray((count + 7) // 8)
+        if count % 8:
+            # Padding bits past the end are never free
+            self._bitmap[-1] = 0xff & ~((1 << (count % 8)) - 1)
+
+    @classmethod
+    def from_ipv4_pool(cls, pool: str) -> 'AddressAllocator':
+        address_pool = ipaddress.IPv4Network(pool, strict=False)
+        first = int(address_pool.network_address)
+        if address_pool.prefixlen < 31:
+            # Skip the network and broadcast addresses
+            return cls(pool, address_pool.prefixlen, first + 1,
+                       address_pool.num_addresses - 2)
+        return cls(pool, address_pool.prefixlen, first,
+                   address_pool.num_addresses)
+
+    @classmethod
+    def from_ipv4ll(cls) -> 'AddressAllocator':
+        # 169.254.1.0 - 169.254.254.255, see RFC 3927
+        return cls('169.254.0.0/16', 16, 0xa9fe0100,
+                   0xa9fefeff - 0xa9fe0100 + 1)
+
+    def __len__(self) -> int:
+        return self._used
+
+    def available(self) -> int:
+        return self._count - self._used
+
+    def full(self) -> bool:
+        return self._used >= self._count
+
+    def reserve(self, address: int) -> bool:
+        offset = address - self._first
+        if not 0 <= offset < self._count:
+            return False
+        mask = 1 << (offset & 7)
+        if self._bitmap[offset >> 3] & mask:
+            return False
+        self._bitmap[offset >> 3] |= mask
+        self._used += 1
+        return True
+
+    def release(self, address: int) -> bool:
+        offset = address - self._first
+        if not 0 <= offset < self._count:
+            return False
+        mask = 1 << (offset & 7)
+        if not self._bitmap[offset >> 3] & mask:
+            return False
+        self._bitmap[offset >> 3] &= ~mask
+        self._used -= 1
+        return True
+
+    def reserve_all(self,
+                    addresses: Iterable[Optional[AddressType]]) -> None:
+        for address in addresses:
+            if address is not None and address[0] == 4:
+                self.reserve(address[1])
+
+    def release_all(self,
+                    addresses: Iterable[Optional[AddressType]]) -> None:
+        for address in addresses:
+            if address is not None and address[0] == 4:
+                self.release(address[1])
+
+    def allocate(self) -> Optional[int]:
+        if self.full():
+            return None
+        for _ in range(self.PROBES):
+            offset = random.randrange(self._count)
+            if not self._bitmap[offset >> 3] & (1 << (offset & 7)):
+                return self._take(offset)
+        # The pool is mostly full, take the first free slot after a random
+        # position instead of retrying without bound
+        start = random.randrange(len(self._bitmap))
+        match = self._FREE_BYTE.search(self._bitmap, start)
+        if match is None:
+            match = self._FREE_BYTE.search(self._bitmap, 0, start)
+        assert match is not None
+        index = match.start()
+        byte = self._bitmap[index]
+        bit = (~byte & (byte + 1)).bit_length() - 1
+        return self._take(index * 8 + bit)
+
+    def _take(self, offset: int) -> int:
+        self._bitmap[offset >> 3] |= 1 << (offset & 7)
+        self._used += 1
+        return self._first + offset
+
+
+# Writer for the Config layout ([Network], [Node.*], [PeerBlacklist]).
+# It follows the section order and value formatting of toml.dumps(), so files
+# stay byte-identical for ordinary values, but writes one section at a time
+# instead of building the whole document in memory.
+_TOML_BARE_KEY = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _toml_normalized(value: Any) -> Any:
+    # value as toml.loads() returns it after dump_toml(): without the None
+    # values the dump leaves out, and with lists for tuples outside of a
+    # Node. Whatever is already in that form is returned as it is, not
+    # copied.
+    value_type = type(value)
+    if value_type is Node:
+        # Node never holds None and keeps its arrays as tuples whichever
+        # way it was built, only the tables in _extra may need work
+        extra = value._extra
+        if extra is None:
+            return value
+        normalized_extra = {
+            k: _toml_normalized(v) if isinstance(v, dict) else v
+            for k, v in extra.items()
+        }
+        if all(v is extra[k] for k, v in normalized_extra.items()):
+            return value
+        node = Node()
+        node.__setstate__(value.__getstate__()[:-1] + (normalized_extra, ))
+        return node
+    elif isinstance(value, dict):
+        items = [(k, _toml_normalized(v)) for k, v in value.items()
+                 if v is not None]
+        if len(items) == len(value) and all(
+                v is value[k] for k, v in items):
+            return value
+        table: SortedDict[str, Any] = SortedDict()
+        for k, v in items:
+            table[k] = v
+        return table
+    elif value_type is tuple or value_type is list:
+        items = [_toml_normalized(i) for i in value]
+        if value_type is list and all(
+                i is j for i, j in zip(items, value)):
+            return value
+        return items
+    return value
+
+
+def dump_toml(conf: Dict[str, Any], out: TextIO) -> None:
+    written = False
+    values, sections = _dump_toml_table(conf)
+    if values:
+        out.write(values)
+        written = True
+    while sections:
+        subsections: List[Tuple[str, Dict[str, Any]]] = []
+        for name, table in sections:
+            values, children = _dump_toml_table(table)
+            if values or not children:
+                if written:
+                    out.write('\n')
+                out.write('[' + name + ']\n' + values)
+                written = True
+            subsections.extend(
+                (name + '.' + child, subtable) for child, subtable in children)
+        subsections.sort(key=lambda i: i[0])
+        sections = subsections
+
+
+def _dump_toml_table(
+        table: Dict[str, Any]) -> Tuple[str, List[Tuple[str, Dict[str, Any]]]]:
+    lines: List[str] = []
+    children: List[Tuple[str, Dict[str, Any]]] = []
+    for key, value in table.items():
+        if isinstance(value, dict) or type(value) is Node:
+            children.append((_dump_toml_key(key), value))
+        elif value is not None:
+            # The same few field names repeat in every node
+            quoted = _toml_field_keys.get(key)
+            if quoted is None:
+                quoted = _dump_toml_key(key)
+                if len(_toml_field_keys) < 1024:
+                    _toml_field_keys[key] = quoted
+            lines.append(quoted + ' = ' + _dump_toml_value(value) + '\n')
+    children.sort(key=lambda i: i[0])
+    return ''.join(lines), children
+
+
+_toml_field_keys: Dict[Any, str] = {}
+
+
+def _dump_toml_key(key: Any) -> str:
+    key = str(key)
+    if _TOML_BARE_KEY.match(key):
+        return key
+    return _dump_toml_str(key)
+
+
+def _dump_toml_str(value: str) -> str:
+    if value.isascii() and value.isprintable() and (
+            '"' not in value and '\\' not in value):
+        return '"' + value + '"'
+    # JSON string escapes are valid TOML basic string escapes, except that
+    # TOML also forbids a raw DEL
+    return json.dumps(value, ensure_ascii=False).replace('\x7f', '\\u007f')
+
+
+def _dump_toml_value(value: Any) -> str:
+    value_type = type(value)
+    if value_type is str:
+        return _dump_toml_str(value)
+    elif value_type is bool:
+        return 'true' if value else 'false'
+    elif value_type is int:
+        return str(value)
+    elif isinstance(value, (list, tuple)):
+        return '[' + ''.join([
+            ' ' + (_dump_toml_str(i) if type(i) is str else
+                   _dump_toml_value(i)) + ',' for i in value
+        ]) + ']'
+    import toml
+    return str(toml.TomlEncoder().dump_value(value))
 
 
 def genpsk() -> bytes:
+    import nacl.bindings
     return cast(bytes, nacl.bindings.randombytes(32))
 
 
 def genkey() -> bytes:
-    secret = bytearray(nacl.bindings.randombytes(32))
-    # curve25519_normalize_secret
-    secret[0] &= 248
-    secret[31] &= 127
-    secret[31] |= 64
-    return bytes(secret)
+    return genkeys(1)[0]
+
+
+def genkeys(count: int) -> List[bytes]:
+    import nacl.bindings
+    # Draw the key material for all keys at once
+    random_bytes = bytearray(nacl.bindings.randombytes(32 * count))
+    secrets: List[bytes] = []
+    for i in range(0, 32 * count, 32):
+        secret = random_bytes[i:i + 32]
+        # curve25519_normalize_secret
+        secret[0] &= 248
+        secret[31] &= 127
+        secret[31] |= 64
+        secrets.append(bytes(secret))
+    return secrets
+
+
+class PubkeyCache():
+    # Memoizes Curve25519 public key derivation, keyed by private key.
+    # The sidecar file next to <iface>.conf only stores a digest of each
+    # private key, so it does not duplicate any secret material.
+    def __init__(self) -> None:
+        self._keys: Dict[bytes, bytes] = {}
+        # private key -> public key
+        self._persisted: Dict[bytes, bytes] = {}
+        # digest of private key -> public key, read from sidecar files
+        self._saved: Dict[str, Set[str]] = {}
+        # sidecar file name -> lines last read from or written to it
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(secret: bytes) -> bytes:
+        return hashlib.blake2b(secret, digest_size=16).digest()
+
+    def known_keys(self) -> Dict[bytes, bytes]:
+        return dict(self._keys)
+
+    def add_known_keys(self, keys: Dict[bytes, bytes]) -> None:
+        # Keys derived by another process, e.g. a parallel batch worker
+        self._keys.update(keys)
+
+    def get(self, secret: bytes) -> bytes:
+        public = self._keys.get(secret)
+        if public is None and self._persisted:
+            public = self._persisted.get(self.digest(secret))
+        if public is None:
+            import nacl.bindings
+            self.misses += 1
+            profiler.count('pubkey derivations')
+            with profiler.phase('pubkey.derive'):
+                public = cast(bytes,
+                              nacl.bindings.crypto_scalarmult_base(secret))
+        else:
+            self.hits += 1
+        self._keys[secret] = public
+        return public
+
+    def invalidate(self, secret_base64: Optional[str]) -> None:
+        if not secret_base64:
+            return
+        try:
+            secret = binascii.a2b_base64(secret_base64)
+        except binascii.Error:
+            return
+        self._keys.pop(secret, None)
+        self._persisted.pop(self.digest(secret), None)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def load(self, cache_name: str) -> None:
+        lines: Set[str] = set()
+        try:
+            with open(cache_name, 'r') as cache_file:
+                if not _is_trusted_file(cache_file.fileno()):
+                    # Rewritten by the next save()
+                    self._saved[cache_name] = lines
+                    return
+                for line in cache_file:
+                    line = line.strip()
+                    try:
+                        digest_hex, public_base64 = line.split(' ', 1)
+                        digest = binascii.a2b_hex(digest_hex)
+                        public = binascii.a2b_base64(public_base64)
+                    except (ValueError, binascii.Error):
+                        continue
+                    if len(digest) != 16 or len(public) != 32:
+                        continue
+                    self._persisted[digest] = public
+                    lines.add(line)
+        except FileNotFoundError:
+            pass
+        self._saved[cache_name] = lines
+
+    def save(self, cache_name: str, nodes: Dict[str, Node]) -> None:
+        # Rebuild the sidecar from the current node set, so entries of
+        # deleted nodes or replaced private keys are dropped
+        lines: Set[str] = set()
+        for node in nodes.values():
+            secret = node.secret()
+            if secret is None:
+                continue
+            digest = self.digest(secret)
+            public = self._keys.get(secret) or self._persisted.get(digest)
+            if public is None:
+                continue
+            lines.add('{} {}'.format(
+                binascii.b2a_hex(digest).decode('ascii'),
+                binascii.b2a_base64(public, newline=False).decode('ascii')))
+        if lines == self._saved.get(cache_name, set()):
+            return
+        try:
+            write_atomic(cache_name,
+                         ''.join((line + '\n' for line in sorted(lines))),
+                         mode=0o600)
+        except OSError:
+            # The cache is only an optimization
+            return
+        self._saved[cache_name] = lines
+
+
+pubkey_cache = PubkeyCache()
 
 
 def pubkey(secret: bytes) -> bytes:
-    return cast(bytes, nacl.bindings.crypto_scalarmult_base(secret))
-    # return nacl.bindings.crypto_scalarmult_base(secret)
+    return pubkey_cache.get(secret)
+
+
+class _HashingWriter():
+    # Hashes the encoded bytes of everything written through it
+    def __init__(self, out: TextIO) -> None:
+        self._out = out
+        self._encoding = out.encoding or 'utf-8'
+        self._hash = hashlib.blake2b(digest_size=16)
+
+    def write(self, data: str) -> int:
+        self._hash.update(data.encode(self._encoding))
+        return self._out.write(data)
+
+    def digest(self) -> bytes:
+        return self._hash.digest()
+
+
+def _is_trusted_file(fd: int) -> bool:
+    # Caches are only read when nobody but this user can have written them
+    st = os.fstat(fd)
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+def write_atomic(file_name: str,
+                 data: Union[str, bytes, Callable[[TextIO], None]],
+                 mode: int = 0o666,
+                 sync_dir: bool = True) -> None:
+    # data is either the content or a function writing it to the file.
+    # Without sync_dir the rename is durable only once the caller syncs
+    # the directory, e.g. by a later write_atomic() into it.
+    tmp_name = '{}.{}.tmp'.format(file_name, os.getpid())
+    try:
+        fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with open(fd, 'wb' if isinstance(data, bytes) else 'w') as tmp_file:
+            if isinstance(data, (str, bytes)):
+                tmp_file.write(data)
+            else:
+                data(tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_name, file_name)
+    except Exception:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    if sync_dir:
+        dir_fd = os.open(os.path.dirname(file_name) or '.', os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
 
 def generate_pubkey_macaddr(node: Config.NodeType) -> Optional[str]:
-    if 'PrivateKey' not in node:
-        return None
-    secret_base64: str = node['PrivateKey']
-    secret: bytes = binascii.a2b_base64(secret_base64)
-    if len(secret) != 32:
+    secret = node.secret()
+    if secret is None:
         return None
 
     macaddr = pubkey(secret)[-6:]
@@ -299,20 +1341,25 @@ def generate_pubkey_ipv6(network: Config.NetworkType,
     address_pool = ipaddress.IPv6Network(network['AddressPoolIPv6'],
                                          strict=False)
 
-    if 'PrivateKey' not in node:
-        return None
-    secret_base64: str = node['PrivateKey']
-    secret: bytes = binascii.a2b_base64(secret_base64)
-    if len(secret) != 32:
+    address = pubkey_ipv6_address(address_pool, node)
+    if address is None:
         return None
-
-    host = ipaddress.IPv6Address(pubkey(secret)[-16:])
-    ipv6 = ipaddress.IPv6Address(
-        int(address_pool.network_address)
-        | (int(host) & int(address_pool.hostmask)))
+    ipv6 = ipaddress.IPv6Address(address)
 
     return ipv6.compressed + '/' + str(address_pool.prefixlen)
 
 
+def pubkey_ipv6_address(address_pool: ipaddress.IPv6Network,
+                        node: Config.NodeType) -> Optional[int]:
+    # For callers that parse the pool once for all nodes
+    secret = node.secret()
+    if secret is None:
+        return None
+
+    host = int.from_bytes(pubkey(secret)[-16:], 'big')
+    return int(address_pool.network_address) | (host
+                                                & int(address_pool.hostmask))
+
+
 if __name__ == "__main__":
     pass
@@ -1,9 +1,35 @@
 import binascii
+import errno
 import sys
 from typing import List
 from . import common
 
+# Keys are drawn, derived and written this many at a time, which keeps the
+# memory flat for any --count
+CHUNK_SIZE = 65536
 
-def vw_genkey() -> int:
-    print(binascii.b2a_base64(common.genkey(), newline=False).decode('ascii'))
+
+def vw_genkey(count: int = 1, with_pub: bool = False) -> int:
+    if count < 1:
+        print('vwgen: --count must be at least 1', file=sys.stderr)
+        return errno.EINVAL
+    if with_pub:
+        import nacl.bindings
+
+    for start in range(0, count, CHUNK_SIZE):
+        secrets = common.genkeys(min(CHUNK_SIZE, count - start))
+        if with_pub:
+            # Fresh keys never hit the pubkey cache, derive them directly
+            lines: List[str] = [
+                binascii.b2a_base64(secret, newline=False).decode('ascii') +
+                ' ' + binascii.b2a_base64(
+                    nacl.bindings.crypto_scalarmult_base(secret)).decode(
+                        'ascii') for secret in secrets
+            ]
+        else:
+            lines = [
+                binascii.b2a_base64(secret).decode('ascii')
+                for secret in secrets
+            ]
+        sys.stdout.write(''.join(lines))
     return 0
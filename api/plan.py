@@ -0,0 +1,239 @@
+import argparse
+import errno
+import os
+import re
+import shlex
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+from . import common
+from .profiling import profiler
+from .showconf import render_conf
+
+# What a rendered conf sets up once wg-quick brings it up, parsed back from
+# the conf text so the plan follows render_conf() exactly
+StateType = Dict[str, Any]
+
+# Conf lines render_conf() writes for the VXLAN device, everything else
+# in the scripts belongs to the user
+VXLAN_LINK = re.compile(
+    r'^ip link add v%i (?:address (\S+) )?mtu (\d+) type vxlan id (\d+) '
+    r'dstport (\d+) ttl 1 noudpcsum \|\| true$')
+VXLAN_ADDRESS = re.compile(r'^ip address add (\S+) dev v%i \|\| true$')
+VXLAN_FDB = re.compile(
+    r'^bridge fdb append 00:00:00:00:00:00 dev v%i dst (\S+) via %i$')
+SCRIPT_FIELDS = ('PreUp', 'PostUp', 'PreDown', 'PostDown')
+
+
+def vw_plan(args: argparse.Namespace) -> int:
+
+    network_name, node_name = args.interface[0], args.node
+
+    config = args.config
+    network = config.network()
+    nodes = config.nodes()
+    blacklist = config.blacklist()
+
+    if node_name not in nodes:
+        print("vwgen: Network '{}' does not have node '{}'".format(
+            network_name, node_name),
+              file=sys.stderr)
+        return errno.ENOENT
+    if os.sep in node_name or node_name in ('.', '..'):
+        print("vwgen: Node name '{}' is not a valid file name".format(
+            node_name),
+              file=sys.stderr)
+        return errno.EINVAL
+
+    # The conf last planned for the node, unless told which conf its
+    # interface runs
+    old_name = args.from_conf or '{}.plan-{}.conf'.format(
+        config.network_name(), node_name)
+    try:
+        with open(old_name, 'r') as old_file:
+            old_conf = old_file.read()
+    except FileNotFoundError:
+        print("vwgen: No previous plan for node '{}', pass the conf its "
+              'interface runs with --from'.format(node_name),
+              file=sys.stderr)
+        return errno.ENOENT
+    except OSError as e:
+        print("vwgen: Unable to read '{}': {}".format(old_name, e.strerror),
+              file=sys.stderr)
+        return e.errno or errno.EIO
+
+    with profiler.phase('render'):
+        conf = render_conf(network, nodes, blacklist, node_name)
+    with profiler.phase('plan'):
+        commands, restart = plan_commands(
+            os.path.basename(config.network_name()), parse_conf(old_conf),
+            parse_conf(conf))
+    for command in commands:
+        print(command)
+    for reason in restart:
+        print("vwgen: {} of node '{}' changed, restart its interface to "
+              'apply it'.format(reason, node_name),
+              file=sys.stderr)
+    sys.stdout.flush()
+
+    if args.dry_run or (conf == old_conf and not args.from_conf):
+        return 0
+    state_name = '{}.plan-{}.conf'.format(config.network_name(), node_name)
+    try:
+        common.write_atomic(state_name, conf, mode=0o600)
+    except OSError as e:
+        print("vwgen: Unable to write '{}': {}".format(
+            state_name, e.strerror),
+              file=sys.stderr)
+        return e.errno or errno.EIO
+    return 0
+
+
+def parse_conf(conf: str) -> StateType:
+    interface: Dict[str, Any] = {
+        'Address': [],
+        'VxlanAddress': [],
+        'Fdb': [],
+    }
+    for field in SCRIPT_FIELDS:
+        interface[field] = []
+    peers: Dict[str, Dict[str, str]] = {}
+    section: Optional[Dict[str, Any]] = None
+    for line in conf.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            # Comments, and the peers commented out by the blacklist
+            continue
+        if line == '[Interface]':
+            section = interface
+            continue
+        if line == '[Peer]':
+            section = {}
+            peers[str(len(peers))] = section
+            continue
+        if section is None or '=' not in line:
+            continue
+        key, value = (i.strip() for i in line.split('=', 1))
+        if section is not interface:
+            section[key] = value
+        elif key == 'Address':
+            interface['Address'] += [i.strip() for i in value.split(',')]
+        elif key in SCRIPT_FIELDS:
+            for pattern, field in ((VXLAN_LINK, 'VxlanLink'),
+                                   (VXLAN_ADDRESS, 'VxlanAddress'),
+                                   (VXLAN_FDB, 'Fdb')):
+                match = pattern.match(value)
+                if match:
+                    if field == 'VxlanLink':
+                        interface[field] = match.groups()
+                    else:
+                        interface[field].append(match.group(1))
+                    break
+            else:
+                interface[key].append(value)
+        else:
+            interface[key] = value
+    return {
+        'Interface': interface,
+        'Peers': {
+            peer['PublicKey']: peer
+            for peer in peers.values() if 'PublicKey' in peer
+        },
+    }
+
+
+def diff(old: List[str], new: List[str]) -> Tuple[List[str], List[str]]:
+    # (deleted, added), each in the order of its own list
+    old_set, new_set = set(old), set(new)
+    return ([i for i in old if i not in new_set],
+            [i for i in new if i not in old_set])
+
+
+def plan_commands(interface_name: str, old_state: StateType,
+                  state: StateType) -> Tuple[List[str], List[str]]:
+    # (commands, what only a restart applies). Removals go first, so an
+    # address or destination moving between peers is never held twice.
+    wg = shlex.quote(interface_name)
+    vxlan = shlex.quote('v' + interface_name)
+    old, new = old_state['Interface'], state['Interface']
+    old_peers, peers = old_state['Peers'], state['Peers']
+    commands: List[str] = []
+    restart: List[str] = []
+
+    fdb_deleted, fdb_added = diff(old['Fdb'], new['Fdb'])
+    for address in fdb_deleted:
+        commands.append(
+            'bridge fdb del 00:00:00:00:00:00 dev {} dst {}'.format(
+                vxlan, shlex.quote(address)))
+    for public_key in old_peers:
+        if public_key not in peers:
+            commands.append('wg set {} peer {} remove'.format(
+                wg, shlex.quote(public_key)))
+
+    if old.get('PrivateKey') != new.get('PrivateKey'):
+        commands.append(
+            "printf '%s\\n' {} | wg set {} private-key /dev/stdin".format(
+                shlex.quote(new.get('PrivateKey', '')), wg))
+    if old.get('ListenPort') != new.get('ListenPort'):
+        commands.append('wg set {} listen-port {}'.format(
+            wg, shlex.quote(new.get('ListenPort', '0'))))
+    if old.get('FwMark') != new.get('FwMark'):
+        commands.append('wg set {} fwmark {}'.format(
+            wg, '0x' + new['FwMark'] if 'FwMark' in new else 'off'))
+    if old.get('MTU') != new.get('MTU'):
+        commands.append('ip link set dev {} mtu {}'.format(
+            wg, shlex.quote(new.get('MTU', '1420'))))
+    for device, field in ((wg, 'Address'), (vxlan, 'VxlanAddress')):
+        deleted, added = diff(old[field], new[field])
+        for address in deleted:
+            commands.append('ip address del {} dev {}'.format(
+                shlex.quote(address), device))
+        for address in added:
+            commands.append('ip address add {} dev {}'.format(
+                shlex.quote(address), device))
+
+    old_link = old.get('VxlanLink', (None, None, None, None))
+    link = new.get('VxlanLink', (None, None, None, None))
+    if old_link[0] != link[0] and link[0] is not None:
+        commands.append('ip link set dev {} address {}'.format(
+            vxlan, shlex.quote(link[0])))
+    if old_link[1] != link[1] and link[1] is not None:
+        commands.append('ip link set dev {} mtu {}'.format(
+            vxlan, shlex.quote(link[1])))
+    if old_link[2:] != link[2:]:
+        restart.append('The VXLAN id or port')
+    for field in SCRIPT_FIELDS:
+        if old[field] != new[field]:
+            restart.append(field)
+
+    for public_key, peer in peers.items():
+        old_peer = old_peers.get(public_key)
+        if old_peer is not None and old_peer.get(
+                'Endpoint') and not peer.get('Endpoint'):
+            # wg cannot forget an endpoint, the peer is added afresh
+            commands.append('wg set {} peer {} remove'.format(
+                wg, shlex.quote(public_key)))
+            old_peer = None
+        options = []
+        for field, option, unset in (('AllowedIPs', 'allowed-ips', ''),
+                                     ('Endpoint', 'endpoint', None),
+                                     ('PersistentKeepalive',
+                                      'persistent-keepalive', 'off')):
+            value = peer.get(field)
+            if old_peer is not None and old_peer.get(field) == value:
+                continue
+            if field == 'AllowedIPs' and value is not None:
+                value = ','.join(i.strip() for i in value.split(','))
+            if value is None:
+                if old_peer is None or unset is None:
+                    continue
+                value = unset
+            options.append('{} {}'.format(option, shlex.quote(value)))
+        if options or old_peer is None:
+            commands.append('wg set {} peer {} {}'.format(
+                wg, shlex.quote(public_key), ' '.join(options)).rstrip())
+
+    for address in fdb_added:
+        commands.append(
+            'bridge fdb append 00:00:00:00:00:00 dev {} dst {} via {}'.format(
+                vxlan, shlex.quote(address), wg))
+    return commands, restart
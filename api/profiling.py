@@ -0,0 +1,80 @@
+import sys
+import time
+from typing import Dict, List, Optional, TextIO, Tuple
+
+# Per-phase wall time and event counters for `vwgen --profile`. Phases
+# may nest, each one reports its own total including nested phases. When
+# profiling is off, a phase costs one attribute check.
+
+
+class Phase():
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self._profiler = profiler
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> 'Phase':
+        if self._profiler.enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self._profiler.enabled:
+            self._profiler.add(self._name, time.perf_counter() - self._start)
+
+
+class Profiler():
+    def __init__(self) -> None:
+        self.enabled = False
+        self._times: Dict[str, float] = {}
+        self._calls: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._start = 0.0
+
+    def start(self) -> None:
+        # serve profiles each request on its own
+        self._times.clear()
+        self._calls.clear()
+        self._counts.clear()
+        self.enabled = True
+        self._start = time.perf_counter()
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        self._times[name] = self._times.get(name, 0.0) + seconds
+        self._calls[name] = self._calls.get(name, 0) + 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def report(self,
+               peak_memory: Optional[int] = None,
+               out: Optional[TextIO] = None) -> None:
+        if out is None:
+            out = sys.stderr
+        rows: List[Tuple[str, int, float]] = [
+            (name, self._calls[name], seconds)
+            for name, seconds in self._times.items()
+        ]
+        rows.sort(key=lambda row: -row[2])
+        print('vwgen: profile, wall time {:.2f} ms'.format(
+            (time.perf_counter() - self._start) * 1000),
+              file=out)
+        print('  {:<24} {:>8} {:>12}'.format('phase', 'calls', 'total ms'),
+              file=out)
+        for name, calls, seconds in rows:
+            print('  {:<24} {:>8} {:>12.2f}'.format(name, calls,
+                                                    seconds * 1000),
+                  file=out)
+        for name in sorted(self._counts):
+            print('  {:<24} {:>8}'.format(name, self._counts[name]), file=out)
+        if peak_memory is not None:
+            print('  {:<24} {:>8.2f} MiB'.format('peak traced memory',
+                                                 peak_memory / 1048576),
+                  file=out)
+
+
+profiler = Profiler()
@@ -2,25 +2,38 @@ import binascii
 import errno
 import sys
 from typing import List
-from . import common
 
 
 def vw_pubkey() -> int:
+    import nacl.bindings
 
-    # secret_base64 = sys.stdin.buffer.read()
-    # secret_base64 = sys.stdin.readlines()
-    secret_base64 = input()
-    try:
-        secret = binascii.a2b_base64(secret_base64)
-        if len(secret) != 32:
-            raise ValueError
-    except (binascii.Error, ValueError):
+    # One private key per line, each public key is written as soon as its
+    # line is read. Blank lines are skipped.
+    key_count = 0
+    for line_number, line in enumerate(sys.stdin, 1):
+        secret_base64 = line.strip()
+        if not secret_base64:
+            continue
+        try:
+            secret = binascii.a2b_base64(secret_base64)
+            if len(secret) != 32:
+                raise ValueError
+        except (binascii.Error, ValueError):
+            print('vwgen: Key on line {} is not the correct length or format'.
+                  format(line_number),
+                  file=sys.stderr)
+            return errno.EINVAL
+
+        sys.stdout.write(
+            binascii.b2a_base64(
+                nacl.bindings.crypto_scalarmult_base(secret)).decode('ascii'))
+        # A pipe is block buffered, a caller waiting for this key would
+        # wait forever
+        sys.stdout.flush()
+        key_count += 1
+
+    if not key_count:
         print('vwgen: Key is not the correct length or format',
               file=sys.stderr)
         return errno.EINVAL
-
-    print(
-        binascii.b2a_base64(common.pubkey(secret),
-                            newline=False).decode('ascii'))
-
     return 0
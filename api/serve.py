@@ -0,0 +1,221 @@
+import argparse
+import errno
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+# Wire format, one JSON object per line in both directions:
+#   client -> server  {"argv": [...], "cwd": "..."}
+#   server -> client  {"out": "..."}, {"err": "..."}  output as it is written
+#                     {"stdin": true}                  the command reads stdin
+#   client -> server  {"stdin": "..."}                 all of the client stdin
+#   server -> client  {"exit": N}                      last message
+
+# Output is sent once this much has been buffered, and at the end
+FLUSH_SIZE = 65536
+
+
+class Channel():
+    def __init__(self, rfile: Any, wfile: Any) -> None:
+        self._rfile = rfile
+        self._wfile = wfile
+        self._pending: List[Dict[str, Any]] = []
+        self._size = 0
+
+    def write(self, stream: str, data: str) -> None:
+        if not data:
+            return
+        if self._pending and stream in self._pending[-1]:
+            self._pending[-1][stream] += data
+        else:
+            self._pending.append({stream: data})
+        self._size += len(data)
+        if self._size >= FLUSH_SIZE:
+            self.flush()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self._pending.append(message)
+        self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self._wfile.write(''.join(
+            json.dumps(message) + '\n'
+            for message in self._pending).encode('utf-8'))
+        self._wfile.flush()
+        self._pending = []
+        self._size = 0
+
+    def read_stdin(self) -> str:
+        self.send({'stdin': True})
+        line = self._rfile.readline()
+        if not line:
+            raise EOFError
+        return str(json.loads(line.decode('utf-8')).get('stdin', ''))
+
+
+class ChannelWriter(io.TextIOBase):
+    def __init__(self, channel: Channel, stream: str) -> None:
+        self._channel = channel
+        self._stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: str) -> int:
+        self._channel.write(self._stream, data)
+        return len(data)
+
+    def flush(self) -> None:
+        self._channel.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+class ChannelReader(io.TextIOBase):
+    # The client stdin is only fetched if the command actually reads it
+    def __init__(self, channel: Channel) -> None:
+        self._channel = channel
+        self._buffer: Optional[io.StringIO] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def _input(self) -> io.StringIO:
+        if self._buffer is None:
+            self._buffer = io.StringIO(self._channel.read_stdin())
+        return self._buffer
+
+    def read(self, size: Optional[int] = -1) -> str:
+        return self._input().read(size)
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        return self._input().readline(size)
+
+    def isatty(self) -> bool:
+        return False
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server = self.server
+        assert isinstance(server, Server)
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+            argv = [str(i) for i in request['argv']]
+            cwd = str(request['cwd'])
+        except (ValueError, KeyError, TypeError):
+            return
+        channel = Channel(self.rfile, self.wfile)
+        saved = sys.stdin, sys.stdout, sys.stderr
+        sys.stdin = ChannelReader(channel)
+        sys.stdout = ChannelWriter(channel, 'out')
+        sys.stderr = ChannelWriter(channel, 'err')
+        try:
+            exit_code = server.run_command(argv, cwd)
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = saved
+        try:
+            channel.send({'exit': exit_code})
+        except OSError:
+            # The client went away
+            pass
+
+
+class Server(socketserver.UnixStreamServer):
+    # Requests are handled one at a time, which serializes every change to
+    # the networks held in memory
+    def __init__(self, socket_path: str,
+                 run: Callable[[List[str], Dict[str, Any]], int]) -> None:
+        self._run = run
+        # network configs loaded so far, per working directory of the client
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        super().__init__(socket_path, RequestHandler)
+
+    def run_command(self, argv: List[str], cwd: str) -> int:
+        try:
+            os.chdir(cwd)
+        except OSError as e:
+            print("vwgen: Unable to change to '{}': {}".format(cwd, e.strerror),
+                  file=sys.stderr)
+            return e.errno or errno.EIO
+        try:
+            return self._run(argv, self._configs.setdefault(cwd, {}))
+        except SystemExit as e:
+            # argparse exits on usage errors and --help
+            if e.code is None:
+                return 0
+            elif isinstance(e.code, int):
+                return e.code
+            print(e.code, file=sys.stderr)
+            return 1
+        except Exception as e:
+            print('vwgen: {}'.format(e), file=sys.stderr)
+            return 1
+
+
+def bind(socket_path: str,
+         run: Callable[[List[str], Dict[str, Any]], int]) -> Server:
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+    # Only the owner may connect
+    umask = os.umask(0o077)
+    try:
+        return Server(socket_path, run)
+    finally:
+        os.umask(umask)
+
+
+def in_use(socket_path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def vw_serve(args: argparse.Namespace,
+             run: Callable[[List[str], Dict[str, Any]], int]) -> int:
+    socket_path = os.path.abspath(args.socket)
+    if in_use(socket_path):
+        print("vwgen: Another vwgen is already serving on '{}'".format(
+            socket_path),
+              file=sys.stderr)
+        return errno.EADDRINUSE
+    try:
+        server = bind(socket_path, run)
+    except OSError as e:
+        print("vwgen: Unable to listen on '{}': {}".format(
+            socket_path, e.strerror),
+              file=sys.stderr)
+        return e.errno or errno.EIO
+
+    def stop(signum: int, frame: Any) -> None:
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print("vwgen: Serving on '{}'".format(socket_path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+    return 0
@@ -15,8 +15,14 @@ def vw_show(args: argparse.Namespace) -> int:
 
     return_value = 0
     for network_name in args.interface:
-        config = common.Config()
-        if not config.load(network_name):
+        if isinstance(args.config, common.Config) and (
+                network_name == args.interface[0]):
+            # Reuse the caller's config, so a batch sees its own changes
+            config = args.config
+        else:
+            config = common.Config()
+            config.load(network_name)
+        if not config.exists():
             print("vwgen: Unable to find configuration file '{}.conf'".format(
                 network_name),
                   file=sys.stderr)
@@ -45,6 +51,10 @@ def vw_show(args: argparse.Namespace) -> int:
         print('  {}vxlan id:{} {}'.format(BOLD, NORMAL,
                                           network.get('VxlanID', 0)))
 
+        if network.get('Hubs'):
+            print('  {}hubs:{} {}'.format(BOLD, NORMAL,
+                                          ', '.join(network['Hubs'])))
+
         print()
 
         for node_name, node in nodes.items():
@@ -53,8 +63,8 @@ def vw_show(args: argparse.Namespace) -> int:
                                             NORMAL))
 
             secret_base64 = node.get('PrivateKey', '')
-            secret = binascii.a2b_base64(secret_base64)
-            if len(secret) != 32:
+            secret = node.secret()
+            if secret is None:
                 pubkey = '(error)'
             else:
                 pubkey = binascii.b2a_base64(common.pubkey(secret),
@@ -70,7 +80,7 @@ def vw_show(args: argparse.Namespace) -> int:
             print('  {}listen port:{} {}'.format(BOLD, NORMAL,
                                                  node.get('ListenPort', 0)))
 
-            address = node.get('Address', [])
+            address = list(node.get('Address', []))
             pubkey_ipv6 = common.generate_pubkey_ipv6(network, node)
             if pubkey_ipv6:
                 address.append(pubkey_ipv6)
@@ -98,9 +108,7 @@ def vw_show(args: argparse.Namespace) -> int:
             if node.get('UPnP', False):
                 print('  {}upnp:{} true'.format(BOLD, NORMAL))
 
-            node_blacklist: List[str] = [
-                str(i[1]) for i in blacklist if i[0] == node_name
-            ]
+            node_blacklist: List[str] = sorted(blacklist.peers(node_name))
             node_whitelist: List[str] = sorted(
                 set(nodes) - set(node_blacklist) - {node_name})
             print('  {}blacklist:{} {}'.format(BOLD, NORMAL,
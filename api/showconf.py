@@ -1,15 +1,21 @@
 import binascii
 import errno
+import hashlib
+import json
+import os
+import shlex
 import sys
-from typing import List, Optional
+import zlib
+from typing import Any, cast, Dict, List, Optional, Tuple
 from . import common
+from .profiling import profiler
 import argparse
-import qrcode_terminal
+
+DerivedType = Dict[str, Any]
 
 
 def vw_show_conf(args: argparse.Namespace) -> int:
 
-    conf_content: str = ""
     network_name, node_name = args.interface[0], args.nodes
 
     # config = common.Config()
@@ -28,10 +34,299 @@ def vw_show_conf(args: argparse.Namespace) -> int:
             network_name, node_name),
               file=sys.stderr)
         return errno.ENOENT
-    node = nodes[node_name]
+
+    batch_dir = getattr(args, 'batch_dir', '')
+    batch = None
+    if batch_dir:
+        if not args.out_dir:
+            print('vwgen: --batch-dir requires --out-dir', file=sys.stderr)
+            return errno.EINVAL
+        batch = BatchFiles(os.path.join(batch_dir, node_name))
 
     print()
 
+    with profiler.phase('render'):
+        conf_content = render_conf(network, nodes, blacklist, node_name,
+                                   batch=batch)
+    if batch is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+        batch.write(os.path.join(args.out_dir, node_name))
+    print(conf_content)
+    if args.qr_printable:
+        import qrcode_terminal
+        qrcode_terminal.draw(conf_content)
+
+    return 0
+
+
+def vw_show_conf_all(args: argparse.Namespace) -> int:
+
+    network_name, out_dir = args.interface[0], args.out_dir
+
+    if not out_dir:
+        print('vwgen: --all requires --out-dir', file=sys.stderr)
+        return errno.EINVAL
+
+    config = args.config
+    network = config.network()
+    nodes = config.nodes()
+    blacklist = config.blacklist()
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    return_value = 0
+
+    node_names: List[str] = []
+    for node_name in nodes:
+        if os.sep in node_name or node_name in ('', '.', '..'):
+            print("vwgen: Node name '{}' is not a valid file name".format(
+                node_name),
+                  file=sys.stderr)
+            return_value = return_value or errno.EINVAL
+            continue
+        node_names.append(node_name)
+
+    batch_dir = getattr(args, 'batch_dir', '')
+    suffixes = ['.conf'] + (list(BatchFiles.SUFFIXES) if batch_dir else [])
+    manifest_name = os.path.join(out_dir, MANIFEST_NAME)
+    digests = conf_input_digests(network, nodes, blacklist, batch_dir)
+    incremental = getattr(args, 'incremental', False)
+    if incremental:
+        old_digests = load_manifest(manifest_name)
+        node_names = [
+            node_name for node_name in node_names
+            if old_digests.get(node_name) != digests[node_name] or
+            not all(
+                os.path.exists(os.path.join(out_dir, node_name + suffix))
+                for suffix in suffixes)
+        ]
+        for node_name in old_digests:
+            if node_name not in nodes:
+                for suffix in ('.conf', ) + BatchFiles.SUFFIXES:
+                    try:
+                        os.unlink(os.path.join(out_dir, node_name + suffix))
+                    except FileNotFoundError:
+                        pass
+                print("vwgen: Node '{}' was removed".format(node_name),
+                      file=sys.stderr)
+
+    if node_names:
+        render_nodes(network, nodes, blacklist, node_names, out_dir,
+                     getattr(args, 'jobs', 1), batch_dir)
+    save_manifest(manifest_name, {
+        node_name: digests[node_name]
+        for node_name in nodes
+        if os.path.exists(os.path.join(out_dir, node_name + '.conf'))
+    })
+
+    if incremental:
+        # These nodes need their interface reloaded
+        for node_name in node_names:
+            print(node_name)
+
+    return return_value
+
+
+def render_nodes(network: common.Config.NetworkType,
+                 nodes: common.Config.NodesType,
+                 blacklist: common.Config.BlacklistType, node_names: List[str],
+                 out_dir: str, jobs: int, batch_dir: str = '') -> None:
+
+    # Every node shows up as a peer of every other node, so derive the keys
+    # and addresses of each node once up front
+    with profiler.phase('render.derive'):
+        derived = {
+            node_name: derive_node(network, node)
+            for node_name, node in nodes.items()
+        }
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(node_names) <= 1:
+        _init_render_worker(network, nodes, blacklist, derived, out_dir,
+                            batch_dir)
+        for node_name in node_names:
+            _render_worker(node_name)
+        return
+
+    import concurrent.futures
+    # The network is handed to each worker once by the initializer, tasks
+    # only carry node names
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_render_worker,
+            initargs=(network, nodes, blacklist, derived, out_dir,
+                      batch_dir)) as executor:
+        chunksize = max(1, len(node_names) // (jobs * 4))
+        for _ in executor.map(_render_worker, node_names,
+                              chunksize=chunksize):
+            pass
+
+
+# Bump whenever render_conf() output changes for the same inputs
+MANIFEST_VERSION = 2
+MANIFEST_NAME = '.vwgen-manifest.json'
+
+# Fields of the [Network] section and of peers that render_conf() reads
+MANIFEST_NETWORK_FIELDS = ('AddressPoolIPv6', 'VxlanID', 'VxlanMTU',
+                           'VxlanPort')
+MANIFEST_PEER_FIELDS = ('AllowedIPs', 'Endpoint', 'LinkLayerAddress',
+                        'PrivateKey')
+
+
+def conf_input_digests(network: common.Config.NetworkType,
+                       nodes: common.Config.NodesType,
+                       blacklist: common.Config.BlacklistType,
+                       batch_dir: str = '') -> Dict[str, str]:
+
+    def digest(value: Any) -> bytes:
+        return hashlib.blake2b(json.dumps(value, sort_keys=True,
+                                          default=str).encode('utf-8'),
+                               digest_size=16).digest()
+
+    network_digest = digest([MANIFEST_VERSION] +
+                            [network.get(i) for i in MANIFEST_NETWORK_FIELDS] +
+                            ([batch_dir] if batch_dir else []) +
+                            ([network['Hubs']] if network.get('Hubs') else []))
+
+    # A node contributes the same peer block to every other conf, so all
+    # peer blocks fold into a single mesh digest
+    mesh = hashlib.blake2b(digest_size=16)
+    for node_name, node in nodes.items():
+        mesh.update(
+            digest([node_name] + [node.get(i) for i in MANIFEST_PEER_FIELDS] +
+                   [node.get('PersistentKeepalive', 0) != 0]))
+    mesh_digest = mesh.digest()
+
+    return {
+        node_name: hashlib.blake2b(network_digest + mesh_digest +
+                                   digest(dict(node)) +
+                                   digest(sorted(blacklist.peers(node_name))),
+                                   digest_size=16).hexdigest()
+        for node_name, node in nodes.items()
+    }
+
+
+def load_manifest(manifest_name: str) -> Dict[str, str]:
+    try:
+        with open(manifest_name, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get(
+            'Version') != MANIFEST_VERSION:
+        return {}
+    return cast(Dict[str, str], manifest.get('Nodes', {}))
+
+
+def save_manifest(manifest_name: str, digests: Dict[str, str]) -> None:
+    common.write_atomic(
+        manifest_name,
+        json.dumps({
+            'Version': MANIFEST_VERSION,
+            'Nodes': digests
+        },
+                   indent=1,
+                   sort_keys=True) + '\n')
+
+
+_render_state: Optional[Tuple[Any, ...]] = None
+
+
+def _init_render_worker(network: common.Config.NetworkType,
+                        nodes: common.Config.NodesType,
+                        blacklist: common.Config.BlacklistType,
+                        derived: Dict[str, DerivedType], out_dir: str,
+                        batch_dir: str) -> None:
+    global _render_state
+    _render_state = (network, nodes, blacklist, derived, out_dir, batch_dir)
+
+
+def _render_worker(node_name: str) -> str:
+    assert _render_state is not None
+    network, nodes, blacklist, derived, out_dir, batch_dir = _render_state
+    batch = BatchFiles(os.path.join(batch_dir,
+                                    node_name)) if batch_dir else None
+    with profiler.phase('render'):
+        conf_content = render_conf(network, nodes, blacklist, node_name,
+                                   derived, batch)
+    with profiler.phase('render.write'):
+        # save_manifest() syncs out_dir once all nodes are written
+        common.write_atomic(os.path.join(out_dir, node_name + '.conf'),
+                            conf_content,
+                            mode=0o600,
+                            sync_dir=False)
+        if batch is not None:
+            batch.write(os.path.join(out_dir, node_name), sync_dir=False)
+    return node_name
+
+
+class BatchFiles():
+    # `ip -batch` and `bridge -batch` input for the VXLAN device of a node,
+    # so bring-up runs two commands instead of one per address and peer.
+    # The files keep the v%i and %i of the conf: wg-quick replaces %i in the
+    # hooks only, so the hook pipes each file through sed, whose pattern
+    # %[i] it leaves alone.
+    SUFFIXES = ('.ip', '.bridge')
+
+    def __init__(self, path: str) -> None:
+        # path on the node, without the suffix
+        self.path = path
+        self.ip = ''
+        self.bridge = ''
+
+    def hook(self, suffix: str, command: str) -> str:
+        return "sed 's/%[i]/%i/g' {} | {} -batch -".format(
+            shlex.quote(self.path + suffix), command)
+
+    def write(self, file_name: str, sync_dir: bool = True) -> None:
+        # file_name without the suffix, both files share one directory sync
+        common.write_atomic(file_name + '.ip',
+                            self.ip,
+                            mode=0o600,
+                            sync_dir=False)
+        common.write_atomic(file_name + '.bridge',
+                            self.bridge,
+                            mode=0o600,
+                            sync_dir=sync_dir)
+
+
+def derive_node(network: common.Config.NetworkType,
+                node: common.Config.NodeType) -> DerivedType:
+    derived = derive_peer(node)
+    derived['MacAddress'] = common.generate_pubkey_macaddr(node)
+    derived['PubkeyIPv6'] = common.generate_pubkey_ipv6(network, node)
+    return derived
+
+
+def derive_peer(node: common.Config.NodeType) -> DerivedType:
+    # The values every other conf shows of this node, formatted once
+    return {
+        'PublicKey': derive_pubkey(node),
+        'AllowedIPs': node.get('AllowedIPs'),
+        'FdbDestinations': [
+            str(address).split('/', 1)[0]
+            for address in node.get('LinkLayerAddress', [])
+        ],
+    }
+
+
+def render_conf(network: common.Config.NetworkType,
+                nodes: common.Config.NodesType,
+                blacklist: common.Config.BlacklistType,
+                node_name: str,
+                derived: Optional[Dict[str, DerivedType]] = None,
+                batch: Optional[BatchFiles] = None) -> str:
+
+    conf_content: str = ""
+    node = nodes[node_name]
+    if derived is None:
+        derived = {
+            peer_name: derive_peer(peer)
+            for peer_name, peer in nodes.items() if peer_name != node_name
+        }
+        derived[node_name] = derive_node(network, node)
+    node_derived = derived[node_name]
+
     conf_content += '[Interface]\n'
     conf_content += 'ListenPort = {:d}\n'.format(node.get('ListenPort', 0))
 
@@ -50,39 +345,63 @@ def vw_show_conf(args: argparse.Namespace) -> int:
         conf_content += 'SaveConfig = true\n'
     for script in node.get('PreUp', []):
         conf_content += 'PreUp = {}\n'.format(script)
-    mac_address = common.generate_pubkey_macaddr(node)
+    mac_address = node_derived['MacAddress']
     mac_address_cmdline = ''
     if mac_address:
         mac_address_cmdline = 'address {} '.format(mac_address)
 
-    conf_content += 'PreUp = ip link add v%i {}mtu {} type vxlan id {} dstport {} ttl 1 noudpcsum || true\n'.format(
+    link_command = 'link add v%i {}mtu {} type vxlan id {} dstport {} ttl 1 noudpcsum'.format(
         mac_address_cmdline, network.get('VxlanMTU', 1500),
         network.get('VxlanID', 0), network.get('VxlanPort', 4789))
+    if batch is None:
+        conf_content += 'PreUp = ip {} || true\n'.format(link_command)
+    else:
+        # -force goes on past errors, as || true did for each command
+        batch.ip += link_command + '\n'
+        conf_content += 'PreUp = {} || true\n'.format(
+            batch.hook('.ip', 'ip -force'))
 
     conf_content += 'PreUp = ethtool -K v%i tx off rx off\n'
     conf_content += 'PreUp = sysctl -w net.ipv4.conf.v%i.accept_redirects=0 net.ipv4.conf.v%i.send_redirects=0 net.ipv6.conf.v%i.accept_redirects=0\n'
-    for address in node.get('Address', []):
-        conf_content += 'PreUp = ip address add {} dev v%i || true\n'.format(
-            address)
-    pubkey_ipv6 = common.generate_pubkey_ipv6(network, node)
+    addresses = list(node.get('Address', []))
+    pubkey_ipv6 = node_derived['PubkeyIPv6']
     if pubkey_ipv6:
-        conf_content += 'PreUp = ip address add {} dev v%i || true\n'.format(
-            pubkey_ipv6)
+        addresses.append(pubkey_ipv6)
+    for address in addresses:
+        if batch is None:
+            conf_content += 'PreUp = ip address add {} dev v%i || true\n'.format(
+                address)
+        else:
+            batch.ip += 'address add {} dev v%i\n'.format(address)
     if node.get('UPnP', False) and node.get('ListenPort', 0) != 0:
         conf_content += 'PreUp = upnpc -r {} udp &\n'.format(
             node['ListenPort'])
+    node_blacklist = blacklist.peers(node_name)
     for peer_name, peer in nodes.items():
         if peer_name == node_name:
             continue
-        in_blacklist = common.NamePair(node_name, peer_name) in blacklist
+        in_blacklist = peer_name in node_blacklist
         comment_prefix = '#' if in_blacklist else ''
 
-        for address in peer.get('LinkLayerAddress', []):
-            conf_content += '{}PostUp = bridge fdb append 00:00:00:00:00:00 dev v%i dst {} via %i\n'.format(
-                comment_prefix,
-                str(address).split('/', 1)[0])
- 
+        for address in derived[peer_name]['FdbDestinations']:
+            if batch is None:
+                conf_content += '{}PostUp = bridge fdb append 00:00:00:00:00:00 dev v%i dst {} via %i\n'.format(
+                    comment_prefix, address)
+            else:
+                batch.bridge += '{}fdb append 00:00:00:00:00:00 dev v%i dst {} via %i\n'.format(
+                    comment_prefix, address)
+
+    if batch is not None:
+        # -force adds the entries after a failing one too, the exit status
+        # still reports the failure as the separate PostUp lines did
+        conf_content += 'PostUp = {}\n'.format(
+            batch.hook('.bridge', 'bridge -force'))
     conf_content += 'PostUp = ip link set v%i up\n'
+    hubs = hub_names(network, nodes)
+    if node_name in hubs:
+        # Leaves reach each other through the hubs, IPv4 only as the link
+        # layer addresses are
+        conf_content += 'PostUp = sysctl -w net.ipv4.conf.%i.forwarding=1 net.ipv4.conf.%i.send_redirects=0\n'
     for script in node.get('PostUp', []):
         conf_content += 'PostUp = {}\n'.format(script)
     for script in node.get('PreDown', []):
@@ -94,30 +413,41 @@ def vw_show_conf(args: argparse.Namespace) -> int:
         conf_content += 'PostDown = {}\n'.format(script)
     conf_content += '\n'
 
+    routes: Optional[Dict[str, List[str]]] = None
+    if hubs and node_name not in hubs:
+        # A leaf only peers with the hubs, and each hub peer also carries
+        # the addresses of the leaves it relays to
+        routes = {hub: list(derived[hub]['AllowedIPs'] or []) for hub in hubs}
+        for peer_name in nodes:
+            if (peer_name == node_name or peer_name in routes
+                    or peer_name in node_blacklist):
+                continue
+            routes[pair_hub(hubs, node_name,
+                            peer_name)] += derived[peer_name]['AllowedIPs'] or []
+
     for peer_name, peer in nodes.items():
-        if peer_name == node_name:
+        if peer_name == node_name or (routes is not None
+                                      and peer_name not in routes):
             continue
-        in_blacklist = common.NamePair(node_name, peer_name) in blacklist
+        in_blacklist = peer_name in node_blacklist
         comment_prefix = '#' if in_blacklist else ''
         conf_content += '{}# Peer node {}\n'.format(comment_prefix, peer_name)
         conf_content += '{}[Peer]\n'.format(comment_prefix)
 
-        if peer.get('PrivateKey'):
-            secret_base64: str = peer['PrivateKey']
-            secret: bytes = binascii.a2b_base64(secret_base64)
-            if len(secret) != 32:
-                print("vwgen: Node '{}' has incorrect PrivateKey".format(
-                    peer_name),
-                      file=sys.stderr)
-            else:
-                pubkey = binascii.b2a_base64(common.pubkey(secret),
-                                             newline=False).decode('ascii')
-                conf_content += '{}PublicKey = {}\n'.format(
-                    comment_prefix, pubkey)
+        peer_derived = derived[peer_name]
+        if peer_derived['PublicKey'] is not None:
+            conf_content += '{}PublicKey = {}\n'.format(
+                comment_prefix, peer_derived['PublicKey'])
+        elif peer.get('PrivateKey'):
+            print("vwgen: Node '{}' has incorrect PrivateKey".format(
+                peer_name),
+                  file=sys.stderr)
 
-        if peer.get('AllowedIPs'):
+        allowed_ips = peer_derived['AllowedIPs'] if routes is None else routes[
+            peer_name]
+        if allowed_ips:
             conf_content += '{}AllowedIPs = {}\n'.format(
-                comment_prefix, ', '.join(peer['AllowedIPs']))
+                comment_prefix, ', '.join(allowed_ips))
         if peer.get('Endpoint'):
             conf_content += '{}Endpoint = {}\n'.format(comment_prefix,
                                                        peer['Endpoint'])
@@ -125,8 +455,27 @@ def vw_show_conf(args: argparse.Namespace) -> int:
             conf_content += '{}PersistentKeepalive = {}\n'.format(
                 comment_prefix, node['PersistentKeepalive'])
         conf_content += '\n'
-    print(conf_content)
-    if args.qr_printable:
-        qrcode_terminal.draw(conf_content)
 
-    return 0
+    return conf_content
+
+
+def hub_names(network: common.Config.NetworkType,
+              nodes: common.Config.NodesType) -> List[str]:
+    # Without hubs every node peers with every other node
+    return [i for i in network.get('Hubs', []) if i in nodes]
+
+
+def pair_hub(hubs: List[str], node_name1: str, node_name2: str) -> str:
+    # Both directions between two leaves go through the same hub, or
+    # WireGuard would drop packets from a peer whose AllowedIPs do not
+    # cover their source
+    pair = '\0'.join(sorted((node_name1, node_name2))).encode('utf-8')
+    return hubs[zlib.crc32(pair) % len(hubs)]
+
+
+def derive_pubkey(node: common.Config.NodeType) -> Optional[str]:
+    secret = node.secret()
+    if secret is None:
+        return None
+    return binascii.b2a_base64(common.pubkey(secret),
+                               newline=False).decode('ascii')
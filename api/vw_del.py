@@ -31,11 +31,17 @@ def vw_del(args: argparse.Namespace) -> int:
                   file=sys.stderr)
             return_value = return_value or errno.ENOENT
             continue
+        common.pubkey_cache.invalidate(nodes[node_name].get('PrivateKey'))
+        config.release_node_addresses(nodes[node_name])
         del nodes[node_name]
 
-        for i in blacklist:
-            if node_name in i:
-                blacklist.remove(i)
+        blacklist.remove_node(node_name)
+        if node_name in network.get('Hubs', []):
+            hubs = [i for i in network['Hubs'] if i != node_name]
+            if hubs:
+                network['Hubs'] = hubs
+            else:
+                del network['Hubs']
 
     config.save()
     config.close()
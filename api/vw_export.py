@@ -1,46 +1,103 @@
-from typing import List, Optional
+from typing import Any, Callable, Iterator, Tuple, TextIO
 import argparse
 import errno
 from . import common
 import json
-import dicttoxml
-import toml
-import yaml
 import sys
 
+# Sections written one entry at a time, so the output for a large network
+# is never built in memory as a whole
+STREAMED_SECTIONS = ('Node', )
+
+
+def plain(value: Any) -> Any:
+    # SortedDict/Node/Blacklist/NamePair to the dict and list types every
+    # serializer understands
+    if isinstance(value, dict) or type(value) is common.Node:
+        return {k: plain(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [plain(i) for i in value]
+    return value
+
+
 class exporter():
     def __init__(self, args):
-        # self.config = common.Config()
-
-        # if not self.config.load(network_name):
-        #     print("vwgen: Unable to find configuration file '{}.conf'".format(
-        #         network_name),
-        #           file=sys.stderr)
-        #     exit(0)
         self.config = args.config
 
-        network = self.config.network()
-        nodes = self.config.nodes()
-        node: Optional[common.Config.NodeType] = None
+    def sections(self) -> Iterator[Tuple[str, Any]]:
+        assert self.config._conf is not None
+        return iter(self.config._conf.items())
 
-        self.config.conf2str()
-        self.dict_context = eval(self.config._conf2str)
+    def write_json(self, out: TextIO) -> None:
+        # Same bytes as json.dumps() of the whole config
+        out.write('{')
+        for i, (key, value) in enumerate(self.sections()):
+            if i:
+                out.write(', ')
+            out.write(json.dumps(key) + ': ')
+            if key in STREAMED_SECTIONS and isinstance(value, dict):
+                out.write('{')
+                for j, (name, item) in enumerate(value.items()):
+                    if j:
+                        out.write(', ')
+                    out.write(json.dumps(name) + ': ' + json.dumps(plain(item)))
+                out.write('}')
+            else:
+                out.write(json.dumps(plain(value)))
+        out.write('}\n')
 
-    def dict2json(self) -> str:
-        json_context :str = json.dumps(self.dict_context)
-        return json_context
+    def write_ndjson(self, out: TextIO) -> None:
+        # One object per line, one line per node. Merging the lines gives
+        # back the document written by write_json().
+        for key, value in self.sections():
+            if key in STREAMED_SECTIONS and isinstance(value, dict):
+                for name, item in value.items():
+                    out.write(json.dumps({key: {name: plain(item)}}) + '\n')
+            else:
+                out.write(json.dumps({key: plain(value)}) + '\n')
 
-    def dict2yaml(self) -> str:
-        yaml_context :str = yaml.dump(self.dict_context)
-        return yaml_context
+    def write_yaml(self, out: TextIO) -> None:
+        import yaml
+        for key, value in self.sections():
+            if key in STREAMED_SECTIONS and isinstance(value, dict) and value:
+                header = None
+                for name, item in value.items():
+                    chunk: str = yaml.dump({key: {name: plain(item)}})
+                    if header is None:
+                        header = chunk[:chunk.index('\n') + 1]
+                        out.write(chunk)
+                    else:
+                        # Drop the repeated section key line
+                        out.write(chunk[len(header):])
+            else:
+                out.write(yaml.dump({key: plain(value)}))
 
-    def dict2xml(self) -> str:
-        xml_context :str = dicttoxml.dicttoxml(self.dict_context)
-        return xml_context
+    def write_xml(self, out: TextIO) -> None:
+        import dicttoxml
+        out.write('<?xml version="1.0" encoding="UTF-8" ?><root>')
+        for key, value in self.sections():
+            if key in STREAMED_SECTIONS and isinstance(value, dict):
+                empty: str = dicttoxml.dicttoxml({
+                    key: {}
+                }, root=False).decode()
+                close = empty.rindex('</')
+                out.write(empty[:close])
+                for name, item in value.items():
+                    out.write(
+                        dicttoxml.dicttoxml({
+                            name: plain(item)
+                        }, root=False).decode())
+                out.write(empty[close:])
+            else:
+                out.write(
+                    dicttoxml.dicttoxml({
+                        key: plain(value)
+                    }, root=False).decode())
+        out.write('</root>\n')
 
-    def dict2toml(self) -> str:
-        toml_context :str = toml.dumps(self.dict_context)
-        return toml_context
+    def write_toml(self, out: TextIO) -> None:
+        assert self.config._conf is not None
+        common.dump_toml(self.config._conf, out)
 
 
 def vw_export(args: argparse.Namespace) -> int:
@@ -49,13 +106,30 @@ def vw_export(args: argparse.Namespace) -> int:
 
     export = exporter(args)
 
+    writer: Callable[[TextIO], None]
     if args.yaml:
-        print(export.dict2yaml())
+        writer = export.write_yaml
+    elif args.ndjson:
+        writer = export.write_ndjson
     elif args.json:
-        print(export.dict2json())
+        writer = export.write_json
     elif args.xml:
-        print(export.dict2xml())
+        writer = export.write_xml
     elif args.toml:
-        print(export.dict2toml())
+        writer = export.write_toml
+    else:
+        writer = export.write_json
+
+    if args.output:
+        # The export contains the private keys
+        try:
+            common.write_atomic(args.output, writer, 0o600)
+        except OSError as e:
+            print("vwgen: Unable to write '{}': {}".format(
+                args.output, e.strerror),
+                  file=sys.stderr)
+            return e.errno or errno.EIO
     else:
-        print(export.dict2json())
+        writer(sys.stdout)
+        sys.stdout.flush()
+    return 0
@@ -55,10 +55,25 @@ def vw_set(args: argparse.Namespace) -> int:
         elif args.vxlan_port:
             network['VxlanPort'] = int(args.vxlan_port)
 
+        elif args.hubs:
+            if args.hubs == 'off':
+                network.pop('Hubs', None)
+            else:
+                hubs = list(map(str.strip, args.hubs.split(',')))
+                for hub in hubs:
+                    if hub not in nodes:
+                        print("vwgen: Network '{}' does not have node '{}'".
+                              format(network_name, hub),
+                              file=sys.stderr)
+                        return_value = return_value or errno.ENOENT
+                if not return_value:
+                    network['Hubs'] = hubs
+
         elif args.addr:
             if node is None:
                 raise InvalidNodeError
             node['Address'] = list(map(str.strip, args.addr.split(',')))
+            config.invalidate_allocators()
 
         elif args.all_ips:
             if node is None:
@@ -110,6 +125,7 @@ def vw_set(args: argparse.Namespace) -> int:
         elif args.private_key:
             if node is None:
                 raise InvalidNodeError
+            common.pubkey_cache.invalidate(node.get('PrivateKey'))
             node['PrivateKey'] = args.private_key
 
         elif args.save_config:
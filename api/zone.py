@@ -25,16 +25,42 @@
 import encodings.idna
 import errno
 import ipaddress
+import json
+import os
 import sys
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, TextIO, Tuple
 from . import common
 import argparse
 
+TTL = 300
+
+# (owner, type, data), owner and data are absolute names
+Record = Tuple[str, str, str]
+
+# The record set and SOA serial last emitted for a zone are kept in
+# '<network>.zone-<zone>', or '<network>.split-zone-<zone>' with --split,
+# so the next run only emits the change. Only the runs that emit changes
+# keep them: a full zone printed to stdout does not.
+STATE_VERSION = 1
+
+# Zone cut for addresses outside every pool, and the longest IPv4 cut. A
+# pool longer than /24 lives in its /24 zone, delegating it further
+# takes RFC 2317 records in the parent zone.
+DEFAULT_CUT = {4: 24, 6: 64}
+BITS = {4: 32, 6: 128}
+LABEL_BITS = {4: 8, 6: 4}
+
 
 def vw_zone(args: argparse.Namespace) -> int:
 
-    print(';; Generated by VxWireguard-Generator')
+    # The zone files are written to --out-dir, stdout only lists the zones
+    # that changed
+    to_files = args.split and not args.nsupdate and not args.ixfr
+    keep_state = args.nsupdate or args.ixfr or to_files
+
+    if not to_files:
+        print(';; Generated by VxWireguard-Generator')
 
     return_value = 0
 
@@ -54,93 +80,290 @@ def vw_zone(args: argparse.Namespace) -> int:
             (c for c in domain_suffix.strip('.') + '.'
              if ord(c) > 32))).decode('ascii').lstrip('.')
 
-        network: Dict[str, Any] = config.network()
-        nodes: Dict[str, dict] = config.nodes()
-
-        print()
-        print(';; Network {}'.format(network_name))
-        print('$ORIGIN                         {}'.format(domain_suffix))
-        print('$TTL                            300')
-
-        A_records: List[str] = []
-        AAAA_records: List[str] = []
-        PTR_IP_records: List[str] = []
-        PTR_IP6_records: List[str] = []
-
-        for node_name, node in nodes.items():
-            safe_node_name = encodings.idna.ToASCII(''.join(
-                (c for c in node_name if ord(c) > 32))).decode('ascii')
-
-            addresses: List[str] = node.get('Address', [])
-
-            pubkey_ipv6: Optional[str] = common.generate_pubkey_ipv6(
-                network, node)
-            if pubkey_ipv6:
-                addresses.append(pubkey_ipv6)
-
-            for address in addresses:
-                address = address.split('/', 1)[0]
-                ip: Optional[ipaddress._BaseAddress] = None
-
+        reverse_zones = ReverseZones(
+            config.network()) if args.split else None
+        zones, error = zone_records(config, domain_suffix, reverse_zones)
+        return_value = return_value or error
+
+        if to_files:
+            os.makedirs(args.out_dir or '.', exist_ok=True)
+        else:
+            print()
+            print(';; Network {}'.format(network_name))
+            if args.nsupdate and args.server:
+                print('server {}'.format(args.server))
+
+        for origin, records in zones.items():
+            # The forward zone has other records with --split
+            state_name = '{}.{}zone-{}'.format(network_name,
+                                               'split-' if args.split else '',
+                                               origin.rstrip('.'))
+            old_serial, old_records = load_state(state_name)
+            if old_records is not None and set(old_records) == set(records):
+                serial = old_serial
+            else:
+                serial = max(old_serial + 1, int(time.time()))
+            soa = soa_record(origin, domain_suffix, serial)
+
+            if args.nsupdate:
+                print_nsupdate(origin, old_records or [], records,
+                               reverse_zones is None)
+            elif args.ixfr:
+                if serial != old_serial:
+                    print_ixfr(
+                        soa_record(origin, domain_suffix, old_serial)
+                        if old_serial else None, old_records or [], soa,
+                        records)
+            elif to_files:
+                zone_name = os.path.join(args.out_dir or '.',
+                                         origin + 'zone')
+                if serial == old_serial and os.path.exists(zone_name):
+                    continue
+                ns = (origin, 'NS', 'ns1.' + domain_suffix)
                 try:
-                    ip = ipaddress.IPv4Address(address)
-                except ipaddress.AddressValueError:
-                    ip = None
-
-                if ip is None:
-                    try:
-                        ip = ipaddress.IPv6Address(address)
-                    except ipaddress.AddressValueError:
-                        pass
-
-                if ip is None:
-                    print("vwgen: Invalid IP address '{}'".format(address),
+                    common.write_atomic(
+                        zone_name,
+                        lambda out: write_zone(out, origin, [soa, ns] +
+                                               records))
+                except OSError as e:
+                    print("vwgen: Unable to write '{}': {}".format(
+                        zone_name, e.strerror),
                           file=sys.stderr)
-                    return_value = return_value or errno.EADDRNOTAVAIL
+                    return_value = return_value or e.errno or errno.EIO
                     continue
+                print(origin.rstrip('.'))
+            else:
+                write_zone(sys.stdout, origin, [soa] + records)
+            sys.stdout.flush()
 
-                if isinstance(ip, ipaddress.IPv4Address):
+            if keep_state and serial != old_serial:
+                try:
+                    save_state(state_name, serial, records)
+                except OSError as e:
+                    print("vwgen: Unable to write '{}': {}".format(
+                        state_name, e.strerror),
+                          file=sys.stderr)
+                    return_value = return_value or e.errno or errno.EIO
 
-                    A_records.append('{}300     IN      A       {}'.format(
-                        pad_to_tab(safe_node_name + '.' + domain_suffix, 32),
-                        ip.compressed))
+        config.close()
 
-                    PTR_IP_records.append(
-                        '{}300     IN      PTR     {}.{}'.format(
-                            pad_to_tab(ip.reverse_pointer + '.', 32),
-                            safe_node_name, domain_suffix))
+    return return_value
 
-                elif isinstance(ip, ipaddress.IPv6Address):
 
-                    AAAA_records.append('{}300     IN      AAAA    {}'.format(
-                        pad_to_tab(safe_node_name + '.' + domain_suffix, 32),
-                        ip.compressed))
+class ReverseZones():
+    # The in-addr.arpa and ip6.arpa zones of the address pools, cut at the
+    # first octet or nibble boundary at or below each pool prefix. Zones
+    # for addresses outside every pool are added as they show up.
+    def __init__(self, network: common.Config.NetworkType) -> None:
+        self.records: Dict[str, List[Record]] = {}
+        # version -> cut length -> address >> (bits - cut) -> origin
+        self._cuts: Dict[int, Dict[int, Dict[int, str]]] = {4: {}, 6: {}}
+        for key in ('AddressPoolIPv4', 'AddressPoolIPv6'):
+            if network.get(key):
+                self._add_pool(ipaddress.ip_network(network[key],
+                                                    strict=False))
+
+    def _add_pool(self, pool: Any) -> None:
+        version = pool.version
+        label_bits = LABEL_BITS[version]
+        cut = -(-pool.prefixlen // label_bits) * label_bits
+        if version == 4:
+            cut = min(cut, DEFAULT_CUT[4])
+        first = int(pool.network_address) >> (BITS[version] - cut)
+        for prefix in range(first, first + 2**max(cut - pool.prefixlen, 0)):
+            self._add_zone(version, cut, prefix)
+
+    def _add_zone(self, version: int, cut: int, prefix: int) -> str:
+        origin = reverse_name(version, prefix << (BITS[version] - cut),
+                              cut // LABEL_BITS[version])
+        self._cuts[version].setdefault(cut, {})[prefix] = origin
+        self.records.setdefault(origin, [])
+        return origin
+
+    def zone(self, version: int, address: int) -> str:
+        for cut, prefixes in self._cuts[version].items():
+            origin = prefixes.get(address >> (BITS[version] - cut))
+            if origin is not None:
+                return origin
+        cut = DEFAULT_CUT[version]
+        return self._add_zone(version, cut, address >> (BITS[version] - cut))
+
+
+def reverse_name(version: int, address: int, labels: int) -> str:
+    # The owner name of the top `labels` octets or nibbles of address
+    if version == 4:
+        octets = address.to_bytes(4, 'big')[:labels]
+        return ''.join('{}.'.format(i)
+                       for i in reversed(octets)) + 'in-addr.arpa.'
+    nibbles = '{:032x}'.format(address)[:labels]
+    return ''.join(i + '.' for i in reversed(nibbles)) + 'ip6.arpa.'
+
+
+def zone_records(
+        config: common.Config, domain_suffix: str,
+        reverse_zones: Optional[ReverseZones]
+) -> Tuple[Dict[str, List[Record]], int]:
+    # A single pass over the nodes. Without reverse_zones everything goes
+    # into the forward zone, A, AAAA, then PTR for IPv4 and IPv6, each in
+    # node order.
+    return_value = 0
 
-                    PTR_IP6_records.append(
-                        '{}300     IN      PTR     {}.{}'.format(
-                            pad_to_tab(ip.reverse_pointer + '.', 80),
-                            safe_node_name, domain_suffix))
+    network: Dict[str, Any] = config.network()
+    nodes: common.Config.NodesType = config.nodes()
 
-        print(
-            '{}300     IN      SOA     ns1.{} hostmaster.{} {:.0f} 86400 7200 604800 300'
-            .format(pad_to_tab(domain_suffix, 32), domain_suffix,
-                    domain_suffix, time.time()))
+    A_records: List[Record] = []
+    AAAA_records: List[Record] = []
+    PTR_IP_records: List[Record] = []
+    PTR_IP6_records: List[Record] = []
 
-        for line in A_records:
-            print(line)
+    pubkey_pool: Optional[ipaddress.IPv6Network] = None
+    if network.get('AddressPoolIPv6'):
+        pubkey_pool = ipaddress.IPv6Network(network['AddressPoolIPv6'],
+                                            strict=False)
 
-        for line in AAAA_records:
-            print(line)
+    for node_name, node in nodes.items():
+        safe_node_name = encodings.idna.ToASCII(''.join(
+            (c for c in node_name if ord(c) > 32))).decode('ascii')
+        host_name = safe_node_name + '.' + domain_suffix
 
-        for line in PTR_IP_records:
+        addresses = node.addresses('Address')
+        if None in addresses:
+            for address, ip in zip(node['Address'], addresses):
+                if ip is None:
+                    print("vwgen: Invalid IP address '{}'".format(
+                        str(address).split('/', 1)[0]),
+                          file=sys.stderr)
+                    return_value = return_value or errno.EADDRNOTAVAIL
+        parsed = [ip[:2] for ip in addresses if ip is not None]
+
+        if pubkey_pool is not None:
+            ip6 = common.pubkey_ipv6_address(pubkey_pool, node)
+            if ip6 is not None:
+                parsed.append((6, ip6))
+
+        for version, ip in parsed:
+            pointer = reverse_name(version, ip, BITS[version] //
+                                   LABEL_BITS[version])
+            if version == 4:
+                A_records.append(
+                    (host_name, 'A', common.format_address(4, ip)))
+                PTR_records = PTR_IP_records
+            else:
+                AAAA_records.append((host_name, 'AAAA',
+                                     common.format_address(6, ip)))
+                PTR_records = PTR_IP6_records
+            if reverse_zones is None:
+                PTR_records.append((pointer, 'PTR', host_name))
+            else:
+                reverse_zones.records[reverse_zones.zone(version, ip)].append(
+                    (pointer, 'PTR', host_name))
+
+    zones = {domain_suffix: A_records + AAAA_records}
+    if reverse_zones is None:
+        zones[domain_suffix] += PTR_IP_records + PTR_IP6_records
+    else:
+        zones.update(reverse_zones.records)
+    return zones, return_value
+
+
+def load_state(state_name: str) -> Tuple[int, Optional[List[Record]]]:
+    # (0, None) when nothing was emitted before
+    try:
+        with open(state_name, 'r') as state_file:
+            state = json.load(state_file)
+        if state.get('version') != STATE_VERSION:
+            return 0, None
+        return int(state['serial']), [
+            (str(owner), str(rtype), str(data))
+            for owner, rtype, data in state['records']
+        ]
+    except FileNotFoundError:
+        return 0, None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print("vwgen: Ignoring unreadable zone state '{}': {}".format(
+            state_name, e),
+              file=sys.stderr)
+        return 0, None
+
+
+def save_state(state_name: str, serial: int, records: List[Record]) -> None:
+    common.write_atomic(
+        state_name,
+        json.dumps({
+            'version': STATE_VERSION,
+            'serial': serial,
+            'records': records
+        }) + '\n')
+
+
+def soa_record(origin: str, domain_suffix: str, serial: int) -> Record:
+    return (origin, 'SOA',
+            'ns1.{} hostmaster.{} {} 86400 7200 604800 300'.format(
+                domain_suffix, domain_suffix, serial))
+
+
+def format_record(record: Record) -> str:
+    owner, rtype, data = record
+    width = 80 if owner.endswith('.ip6.arpa.') else 32
+    return '{}{:<8}IN      {:<8}{}'.format(pad_to_tab(owner, width), TTL,
+                                           rtype, data)
+
+
+def diff(old_records: List[Record],
+         records: List[Record]) -> Tuple[List[Record], List[Record]]:
+    # (deleted, added), each in the order of its own record list
+    old_set: Set[Record] = set(old_records)
+    new_set: Set[Record] = set(records)
+    return ([record for record in old_records if record not in new_set],
+            [record for record in records if record not in old_set])
+
+
+def write_zone(out: TextIO, origin: str, records: List[Record]) -> None:
+    out.write('$ORIGIN                         {}\n'.format(origin))
+    out.write('$TTL                            {}\n'.format(TTL))
+    for record in records:
+        out.write(format_record(record) + '\n')
+
+
+def print_ixfr(old_soa: Optional[Record], old_records: List[Record],
+               soa: Record, records: List[Record]) -> None:
+    # RFC 1995 difference sequence: the old SOA and the deleted records,
+    # then the new SOA and the added records
+    deleted, added = diff(old_records, records)
+    if old_soa is not None:
+        print('del ' + format_record(old_soa))
+    for record in deleted:
+        print('del ' + format_record(record))
+    print('add ' + format_record(soa))
+    for record in added:
+        print('add ' + format_record(record))
+
+
+def print_nsupdate(origin: str, old_records: List[Record],
+                   records: List[Record], mixed: bool) -> None:
+    # RFC 2136 updates for nsupdate(1), the server bumps the SOA serial
+    # itself. When the reverse records are mixed into the forward zone
+    # their zones are unknown, so each reverse owner goes in its own
+    # message and nsupdate finds the zone.
+    deleted, added = diff(old_records, records)
+    reverse: Dict[str, List[str]] = {}
+    forward: List[str] = []
+    for action, changes in (('delete', deleted), ('add', added)):
+        for record in changes:
+            line = 'update {} {}'.format(action, format_record(record))
+            if mixed and record[0].endswith(('.in-addr.arpa.', '.ip6.arpa.')):
+                reverse.setdefault(record[0], []).append(line)
+            else:
+                forward.append(line)
+    if forward:
+        print('zone {}'.format(origin))
+        for line in forward:
             print(line)
-
-        for line in PTR_IP6_records:
+        print('send')
+    for lines in reverse.values():
+        for line in lines:
             print(line)
-
-        config.close()
-
-    return return_value
+        print('send')
 
 
 def pad_to_tab(s: str, min_width: int) -> str:
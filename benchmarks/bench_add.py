@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Times `vwgen add --count N` against adding the same number of nodes one
+# `add -n` call at a time.
+#
+#   python3 benchmarks/bench_add.py --nodes 10000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import add, common  # noqa: E402
+
+
+def add_bulk(conf_name: str, node_count: int) -> None:
+    config = common.Config()
+    config.load(conf_name)
+    config.network()['AddressPoolIPv4'] = '10.0.0.0/8'
+    add.vw_add(
+        argparse.Namespace(interface=[conf_name],
+                           nodes=[],
+                           count=node_count,
+                           prefix='node',
+                           config=config))
+
+
+def add_one_by_one(conf_name: str, node_count: int) -> None:
+    config = common.Config()
+    config.load(conf_name)
+    config.network()['AddressPoolIPv4'] = '10.0.0.0/8'
+    for i in range(node_count):
+        add.vw_add(
+            argparse.Namespace(interface=[conf_name],
+                               nodes=['node{}'.format(i + 1)],
+                               config=config))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--one-by-one',
+                        type=int,
+                        default=500,
+                        help='node count for the one call per node baseline')
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        add_bulk(os.path.join(tmp_dir, 'bulk'), opts.nodes)
+        elapsed = time.perf_counter() - start
+        print('add --count {}: {:.3f} s, {:.0f} nodes/s'.format(
+            opts.nodes, elapsed, opts.nodes / elapsed))
+
+        if opts.one_by_one:
+            start = time.perf_counter()
+            add_one_by_one(os.path.join(tmp_dir, 'single'), opts.one_by_one)
+            elapsed = time.perf_counter() - start
+            print('add -n x {}: {:.3f} s, {:.0f} nodes/s'.format(
+                opts.one_by_one, elapsed, opts.one_by_one / elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
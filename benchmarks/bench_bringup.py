@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Bring-up time of one node conf with its VXLAN device set up by one command
+# per address and peer, against `ls --batch-dir` with one ip -batch and one
+# bridge -batch. The PreUp and PostUp hooks run the way wg-quick runs them,
+# each in a subshell with %i replaced, inside a fresh network namespace.
+# Needs root, bash, iproute2 and unshare. A veth pair stands in for the
+# WireGuard device when the kernel has no wireguard module.
+#
+#   sudo python3 benchmarks/bench_bringup.py --peers 2000
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common, showconf  # noqa: E402
+from network import build_network  # noqa: E402
+
+INTERFACE = 'vwbench'
+
+# wg-quick's execute_hooks(), timed with the same clock around both kinds
+# of hooks. Prints: seconds, failed hooks, fdb entries of the VXLAN device.
+SCRIPT = r'''
+ip link add "$1" type wireguard 2>/dev/null ||
+    ip link add "$1" type veth peer name "$1-peer"
+pre_up=() post_up=()
+while IFS= read -r line; do
+    case "$line" in
+        'PreUp = '*) pre_up+=("${line#PreUp = }") ;;
+        'PostUp = '*) post_up+=("${line#PostUp = }") ;;
+    esac
+done < "$2"
+failed=0
+start=$EPOCHREALTIME
+for hook in "${pre_up[@]}"; do
+    (eval "${hook//%i/$1}") >/dev/null 2>&1 || failed=$((failed + 1))
+done
+ip link set "$1" up
+for hook in "${post_up[@]}"; do
+    (eval "${hook//%i/$1}") >/dev/null 2>&1 || failed=$((failed + 1))
+done
+end=$EPOCHREALTIME
+echo "$start $end" $failed $(bridge fdb show dev "v$1" | grep -c ' dst ')
+'''
+
+
+def bring_up(conf_name: str) -> List[float]:
+    # [seconds, failed hooks, fdb entries]
+    result = subprocess.run(
+        ['unshare', '-n', 'bash', '-c', SCRIPT, 'bash', INTERFACE, conf_name],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+    start, end, failed, fdb_count = result.stdout.split()
+    return [float(end) - float(start), float(failed), float(fdb_count)]
+
+
+def render(conf_name: str, tmp_dir: str, batch_dir: Optional[str]) -> None:
+    config = common.Config()
+    config.load(os.path.join(tmp_dir, 'net'))
+    batch = showconf.BatchFiles(os.path.join(batch_dir, 'node1')) \
+        if batch_dir else None
+    conf = showconf.render_conf(config.network(), config.nodes(),
+                                config.blacklist(), 'node1', batch=batch)
+    if batch is not None:
+        batch.write(os.path.join(tmp_dir, 'node1'))
+    common.write_atomic(conf_name, conf, mode=0o600)
+    config.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--peers', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        build_network(os.path.join(tmp_dir, 'net'), opts.peers + 1).close()
+
+        plain_name = os.path.join(tmp_dir, 'plain.conf')
+        batch_name = os.path.join(tmp_dir, 'batch.conf')
+        render(plain_name, tmp_dir, None)
+        render(batch_name, tmp_dir, tmp_dir)
+
+        print('peers: {}'.format(opts.peers))
+        print('{:<16} {:>10} {:>8} {:>8}'.format('', 'seconds', 'failed',
+                                                  'fdb'))
+        for name, conf_name in (('one per command', plain_name),
+                                ('-batch', batch_name)):
+            runs = [bring_up(conf_name) for _ in range(opts.repeat)]
+            seconds, failed, fdb_count = min(runs)
+            print('{:<16} {:>10.3f} {:>8.0f} {:>8.0f}'.format(
+                name, seconds, failed, fdb_count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Key throughput of one `vwgen key --count N` and one streaming `vwgen pub`
+# against one process per key, as scripts did before --count existed. The
+# per process rate is measured on --single keys and scaled to N.
+#
+#   python3 benchmarks/bench_keys.py --keys 100000 --single 20
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def run(argv: List[str], stdin: str = '') -> str:
+    return subprocess.run([sys.executable, VWGEN] + argv,
+                          input=stdin,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+def timed(name: str, key_count: int, seconds: float) -> None:
+    print('{:<28} {:>10.2f} s {:>12.0f} keys/s'.format(name, seconds,
+                                                        key_count / seconds))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--single',
+                        type=int,
+                        default=20,
+                        help='processes to time for the one key per process '
+                        'rates')
+    opts = parser.parse_args()
+
+    start = time.perf_counter()
+    private_keys = [run(['key']) for _ in range(opts.single)]
+    timed('key, per process', opts.single, time.perf_counter() - start)
+    start = time.perf_counter()
+    for private_key in private_keys:
+        run(['pub'], private_key)
+    timed('pub, per process', opts.single, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    private_keys = run(['key', '--count', str(opts.keys)]).splitlines()
+    timed('key --count', opts.keys, time.perf_counter() - start)
+    start = time.perf_counter()
+    pairs = run(['key', '--count', str(opts.keys), '--with-pub']).splitlines()
+    timed('key --count --with-pub', opts.keys, time.perf_counter() - start)
+    start = time.perf_counter()
+    public_keys = run(['pub'], ''.join(i.split(' ')[0] + '\n'
+                                       for i in pairs)).splitlines()
+    timed('pub, streaming', opts.keys, time.perf_counter() - start)
+
+    if len(private_keys) != opts.keys or public_keys != [
+            i.split(' ')[1] for i in pairs
+    ]:
+        print('pub does not match key --with-pub', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Config.load() time with a cold snapshot cache (TOML parse, snapshot
+# written) against a warm one (snapshot unpickled).
+#
+#   python3 benchmarks/bench_load.py --nodes 1000 10000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common  # noqa: E402
+from network import build_network  # noqa: E402
+
+
+def time_load(conf_name: str, cold: bool) -> float:
+    if cold:
+        try:
+            os.unlink(conf_name + '.snapshot')
+        except FileNotFoundError:
+            pass
+    config = common.Config()
+    start = time.perf_counter()
+    config.load(conf_name)
+    elapsed = time.perf_counter() - start
+    config.close()
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args()
+
+    print('{:>7} {:>10} {:>10} {:>8}'.format('nodes', 'cold ms', 'warm ms',
+                                             'speedup'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for node_count in opts.nodes:
+            conf_name = os.path.join(tmp_dir, 'bench{}'.format(node_count))
+            build_network(conf_name, node_count).close()
+            cold = min(
+                time_load(conf_name, True) for _ in range(opts.repeat))
+            warm = min(
+                time_load(conf_name, False) for _ in range(opts.repeat))
+            print('{:>7} {:>10.1f} {:>10.1f} {:>7.1f}x'.format(
+                node_count, cold * 1000, warm * 1000, cold / warm))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Memory and iteration cost of the slotted common.Node compared with the
+# SortedDict node tables it replaced, and a check that converting between
+# the two is lossless.
+#
+#   python3 benchmarks/bench_nodes.py --nodes 100000
+
+import argparse
+import binascii
+import gc
+import ipaddress
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common, vw_export  # noqa: E402
+
+
+def build_tables(node_count: int) -> List['common.SortedDict[str, Any]']:
+    # The layout `vwgen add` writes, as toml.loads() returns it
+    tables = []
+    for i in range(node_count):
+        table: common.SortedDict[str, Any] = common.SortedDict()
+        table['Address'] = [
+            '10.{}.{}.{}/8'.format(i >> 16, (i >> 8) & 0xff, i & 0xff)
+        ]
+        table['AllowedIPs'] = [
+            '169.254.{}.{}/32'.format((i >> 8) & 0xff, i & 0xff)
+        ]
+        table['FwMark'] = 0
+        table['LinkLayerAddress'] = [
+            '169.254.{}.{}/16'.format((i >> 8) & 0xff, i & 0xff)
+        ]
+        table['ListenPort'] = 32768 + i % 28000
+        table['PersistentKeepalive'] = 0
+        table['PostDown'] = []
+        table['PostUp'] = []
+        table['PreDown'] = []
+        table['PreUp'] = []
+        table['PrivateKey'] = binascii.b2a_base64(
+            os.urandom(32), newline=False).decode('ascii')
+        table['SaveConfig'] = False
+        table['UPnP'] = False
+        tables.append(table)
+    return tables
+
+
+def measure(build: Callable[[], Any]) -> Any:
+    # (result, bytes still allocated by build)
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def best_of(repeat: int, run: Callable[[], Any]) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    tables, tables_size = measure(lambda: build_tables(opts.nodes))
+    # What is left after a load converted the parsed tables
+    nodes, nodes_size = measure(
+        lambda: [common.Node(table) for table in build_tables(opts.nodes)])
+    nodes = [common.Node(table) for table in tables]
+
+    for table, node in zip(tables, nodes):
+        # Node gives its arrays back as tuples
+        if vw_export.plain(node) != vw_export.plain(table) or list(
+                node) != list(table):
+            print('conversion is not lossless: {!r} != {!r}'.format(
+                node, table),
+                  file=sys.stderr)
+            return 1
+
+    print('nodes: {}'.format(opts.nodes))
+    print('{:<28} {:>12} {:>12}'.format('', 'SortedDict', 'Node'))
+    print('{:<28} {:>12.1f} {:>12.1f}'.format('memory MiB',
+                                              tables_size / 1048576,
+                                              nodes_size / 1048576))
+    print('{:<28} {:>12.1f} {:>12.1f}'.format(
+        'snapshot pickle MiB',
+        len(pickle.dumps(tables, protocol=pickle.HIGHEST_PROTOCOL)) / 1048576,
+        len(pickle.dumps(nodes, protocol=pickle.HIGHEST_PROTOCOL)) / 1048576))
+    print('{:<28} {:>12} {:>12.1f}'.format(
+        'convert from TOML ms', '-',
+        best_of(opts.repeat,
+                lambda: [common.Node(table) for table in tables]) * 1000))
+
+    def secrets_base64(items: List[Any]) -> None:
+        for item in items:
+            binascii.a2b_base64(item['PrivateKey'])
+
+    def parse_addresses(items: List[Any]) -> None:
+        # As AddressAllocator used to
+        for item in items:
+            for address in item['Address']:
+                ipaddress.IPv4Address(address.split('/', 1)[0])
+
+    cases: List[Any] = [
+        ('items() (to TOML)', lambda items: [list(i.items()) for i in items],
+         None),
+        ('get(ListenPort)', lambda items: [i.get('ListenPort') for i in items],
+         None),
+        ('Address strings', lambda items: [i['Address'] for i in items], None),
+        ('parse Address', parse_addresses,
+         lambda items: [i.addresses('Address') for i in items]),
+        ('decode PrivateKey', secrets_base64,
+         lambda items: [i.secret() for i in items]),
+        ('dump_toml', lambda items: [
+            common._dump_toml_table(i) for i in items
+        ], None),
+    ]
+    for name, run, typed in cases:
+        table_time = best_of(opts.repeat, lambda: run(tables))
+        node_time = best_of(opts.repeat, lambda: (typed or run)(nodes))
+        print('{:<28} {:>12.1f} {:>12.1f}'.format(name + ' ms',
+                                                  table_time * 1000,
+                                                  node_time * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
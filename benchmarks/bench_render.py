@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Times `vwgen ls --all --out-dir DIR --jobs N` on a synthetic full mesh and
+# checks that every job count writes byte-identical files.
+#
+#   python3 benchmarks/bench_render.py --nodes 1000 --jobs 1 2 4 8
+
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import showconf  # noqa: E402
+from network import build_network  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=500)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conf_name = os.path.join(tmp_dir, 'bench')
+        config = build_network(conf_name, opts.nodes)
+
+        print('nodes: {}, cpus: {}'.format(opts.nodes, os.cpu_count()))
+        print('{:>6} {:>10} {:>8}'.format('jobs', 'seconds', 'speedup'))
+
+        baseline = None
+        reference_dir = None
+        for jobs in opts.jobs:
+            out_dir = os.path.join(tmp_dir, 'out{}'.format(jobs))
+            args = argparse.Namespace(interface=[conf_name],
+                                      out_dir=out_dir,
+                                      jobs=jobs,
+                                      config=config)
+            best = float('inf')
+            for _ in range(opts.repeat):
+                start = time.perf_counter()
+                showconf.vw_show_conf_all(args)
+                best = min(best, time.perf_counter() - start)
+            if baseline is None:
+                baseline = best
+            print('{:>6} {:>10.3f} {:>7.2f}x'.format(jobs, best,
+                                                     baseline / best))
+
+            if reference_dir is None:
+                reference_dir = out_dir
+                continue
+            names = sorted(os.listdir(reference_dir))
+            _, mismatch, errors = filecmp.cmpfiles(reference_dir,
+                                                   out_dir,
+                                                   names,
+                                                   shallow=False)
+            if mismatch or errors:
+                print('output of --jobs {} differs: {}'.format(
+                    jobs, ', '.join(mismatch + errors)),
+                      file=sys.stderr)
+                return 1
+
+        config.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
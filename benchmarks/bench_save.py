@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Serialization time of common.dump_toml() against toml.dumps() for the
+# Config layout, plus the full Config.save() it is used by.
+#
+#   python3 benchmarks/bench_save.py --nodes 100 1000 10000
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+import toml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common, vw_export  # noqa: E402
+from network import build_network  # noqa: E402
+
+
+def best_of(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes',
+                        type=int,
+                        nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    opts = parser.parse_args()
+
+    print('{:>7} {:>14} {:>14} {:>8} {:>12}'.format('nodes', 'toml.dumps ms',
+                                                    'dump_toml ms', 'speedup',
+                                                    'save() ms'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for node_count in opts.nodes:
+            conf_name = os.path.join(tmp_dir, 'bench{}'.format(node_count))
+            config = build_network(conf_name, node_count)
+            names = list(config.nodes())
+            blacklist = config.blacklist()
+            for name1, name2 in zip(names[::7], names[1::7]):
+                blacklist.add(common.NamePair(name1, name2))
+                blacklist.add(common.NamePair(name2, name1))
+            conf = config._conf
+            # toml.dumps() only knows dicts and lists, not common.Node
+            plain_conf = vw_export.plain(conf)
+
+            generic = best_of(lambda: toml.dumps(plain_conf), opts.repeat)
+            schema = best_of(lambda: common.dump_toml(conf, io.StringIO()),
+                             opts.repeat)
+            save = best_of(config.save, opts.repeat)
+            config.close()
+
+            out = io.StringIO()
+            common.dump_toml(conf, out)
+            if toml.loads(out.getvalue()) != toml.loads(
+                    toml.dumps(plain_conf)):
+                print('dump_toml output differs at {} nodes'.format(
+                    node_count),
+                      file=sys.stderr)
+                return 1
+
+            print('{:>7} {:>14.1f} {:>14.1f} {:>7.1f}x {:>12.1f}'.format(
+                node_count, generic * 1000, schema * 1000, generic / schema,
+                save * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Iteration cost of common.SortedDict on a node table and of a
+# common.Blacklist edited between accesses, compared with re-sorting on
+# every access as they used to.
+#
+#   python3 benchmarks/bench_sorted.py --nodes 10000
+
+import argparse
+import os
+import sys
+import timeit
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common  # noqa: E402
+
+
+def build_nodes(node_count: int) -> 'common.SortedDict[str, Any]':
+    nodes: common.SortedDict[str, Any] = common.SortedDict()
+    for i in range(node_count):
+        node: common.SortedDict[str, Any] = common.SortedDict()
+        node['Address'] = ['10.{}.{}.{}/8'.format(i >> 16, (i >> 8) & 0xff,
+                                                 i & 0xff)]
+        node['ListenPort'] = 32768 + i % 28000
+        nodes['node{:05d}'.format(node_count - i)] = node
+    return nodes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=10000)
+    parser.add_argument('--number', type=int, default=100)
+    opts = parser.parse_args()
+
+    nodes = build_nodes(opts.nodes)
+    plain: Dict[str, Any] = dict(nodes)
+
+    cases = [
+        ('iter', lambda: [k for k in nodes],
+         lambda: [k for k in sorted(plain)]),
+        ('keys()', lambda: nodes.keys(), lambda: sorted(plain.keys())),
+        ('items()', lambda: nodes.items(), lambda: sorted(plain.items())),
+    ]
+
+    print('nodes: {}, {} accesses per case'.format(opts.nodes, opts.number))
+    print('{:<10} {:>12} {:>12} {:>8}'.format('access', 'cached ms',
+                                              'resort ms', 'speedup'))
+    for name, cached, resort in cases:
+        cached_time = timeit.timeit(cached, number=opts.number)
+        resort_time = timeit.timeit(resort, number=opts.number)
+        print('{:<10} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+            name, cached_time * 1000, resort_time * 1000,
+            resort_time / cached_time))
+
+    # One mutation between accesses invalidates the cache every time
+    def mutate_and_iterate() -> None:
+        nodes['node00000'] = nodes.pop('node00001')
+        nodes['node00001'] = nodes.pop('node00000')
+        for _ in nodes:
+            pass
+
+    print('{:<10} {:>12.2f}'.format(
+        'mutate+iter',
+        timeit.timeit(mutate_and_iterate, number=opts.number) * 1000))
+
+    names = list(nodes)
+    blacklist = common.Blacklist(
+        (names[i], names[(i + 1) % len(names)]) for i in range(len(names)))
+    pair = common.NamePair(names[0], names[-1])
+
+    def edit_and_iterate(resort: bool) -> Callable[[], None]:
+        def run() -> None:
+            blacklist.add(pair)
+            blacklist.remove(pair)
+            if resort:
+                blacklist._sorted = False
+            for _ in blacklist:
+                pass
+
+        return run
+
+    print('{:<10} {:>12.2f} {:>12.2f}'.format(
+        'blacklist',
+        timeit.timeit(edit_and_iterate(False), number=opts.number) * 1000,
+        timeit.timeit(edit_and_iterate(True), number=opts.number) * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Wall-clock time of single vwgen invocations per subcommand, and a
+# `python -X importtime` budget: the import time of each subcommand must stay
+# under --budget-ms and it must not import the modules only other
+# subcommands need. Exits 1 when a budget is exceeded.
+#
+#   python3 benchmarks/bench_startup.py --repeat 20 --budget-ms 80
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set, Tuple
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+# The config is read from its snapshot after the first load, so no
+# subcommand below needs toml either
+HEAVY_MODULES = {
+    'yaml', 'dicttoxml', 'qrcode_terminal', 'concurrent.futures', 'toml'
+}
+
+SUBCOMMANDS: List[Tuple[str, List[str], Set[str]]] = [
+    ('key', ['key'], {'api.add', 'api.showconf'}),
+    ('psk', ['psk'], {'api.add', 'api.showconf'}),
+    ('pub', ['pub'], {'api.add', 'api.showconf'}),
+    ('show', ['show', '-i', 'bench'], {'api.showconf', 'api.vw_export'}),
+    ('ls', ['ls', '-i', 'bench', '-n', 'node1'], {'api.add', 'api.vw_export'}),
+    ('set', ['set', '-i', 'bench', '-n', 'node1', '--listen-port', '5000'],
+     {'api.add', 'api.showconf'}),
+    ('export', ['export', '-i', 'bench', '--json'], {'api.showconf'}),
+    ('zone', ['zone', '-i', 'bench', '-d', 'example.com'], {'api.showconf'}),
+]
+
+
+def run(argv: List[str], cwd: str, stdin: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + argv,
+                          cwd=cwd,
+                          input=stdin,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True)
+
+
+def import_times(argv: List[str], cwd: str, stdin: str) -> Dict[str, int]:
+    # Cumulative import time in us of every module, from -X importtime
+    result = run(['-X', 'importtime'] + argv, cwd, stdin)
+    times: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith(' ') and not name.startswith('  '):
+            # Top level imports are indented by exactly one space
+            times[name.strip()] = int(cumulative)
+        else:
+            times.setdefault(name.strip(), 0)
+    return times
+
+
+def wall_time(argv: List[str], cwd: str, stdin: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(argv, cwd, stdin)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--budget-ms',
+                        type=float,
+                        default=80,
+                        help='import time budget per subcommand')
+    opts = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        run([VWGEN, 'add', '-i', 'bench', '--count',
+             str(opts.nodes)], tmp_dir, '')
+        # Warm the snapshot, as every invocation after the first would
+        run([VWGEN, 'show', '-i', 'bench'], tmp_dir, '')
+        private_key = subprocess.run([sys.executable, VWGEN, 'key'],
+                                     stdout=subprocess.PIPE,
+                                     universal_newlines=True,
+                                     check=True).stdout
+
+        baseline = wall_time(['-c', 'pass'], tmp_dir, '', opts.repeat)
+        print('python -c pass: {:.1f} ms'.format(baseline * 1000))
+        print('{:<8} {:>9} {:>11}  {}'.format('command', 'wall ms',
+                                              'import ms', 'over budget'))
+        for name, argv, unwanted in SUBCOMMANDS:
+            argv = [VWGEN] + argv
+            stdin = private_key if name == 'pub' else ''
+            times = import_times(argv, tmp_dir, stdin)
+            imported = (HEAVY_MODULES | unwanted) & set(times)
+            import_ms = sum(times.values()) / 1000
+            problems = sorted(imported)
+            if import_ms > opts.budget_ms:
+                problems.insert(0, '{:.1f} ms'.format(import_ms))
+            failed = failed or bool(problems)
+            print('{:<8} {:>9.1f} {:>11.1f}  {}'.format(
+                name,
+                wall_time(argv, tmp_dir, stdin, opts.repeat) * 1000,
+                import_ms, ', '.join(problems) or '-'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# Times the vwgen subcommands on synthetic meshes built through the Config
+# API and writes the results as JSON, as a baseline to compare releases
+# against. Commands go through the real argument parser and dispatch of
+# vwgen.py, without interpreter startup.
+#
+#   python3 benchmarks/bench_suite.py --nodes 10 100 1000 10000 \
+#       --blacklist-density 0.001 --pool-prefix 16 --output baseline.json
+#
+# ls_all renders every peer of every node, so it grows with the square of
+# the node count. Leave it out with --ops for quick runs at 10000 nodes.
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, REPO)
+
+import vwgen  # noqa: E402
+from api import common  # noqa: E402
+from network import build_network  # noqa: E402
+
+OPERATIONS = [
+    'load_cold', 'load_warm', 'save', 'add', 'del', 'set', 'show', 'ls',
+    'ls_all', 'zone', 'zone_split', 'export_json', 'export_toml'
+]
+
+
+def build_mesh(conf_name: str, node_count: int, pool_prefix: int,
+               density: float, rng: random.Random) -> int:
+    # Returns the number of blacklisted node pairs
+    config = build_network(conf_name, node_count, pool_prefix)
+    names = list(config.nodes())
+    pair_count = min(int(round(density * len(names) * (len(names) - 1) / 2)),
+                     len(names) * (len(names) - 1) // 2)
+    blacklist = config.blacklist()
+    pairs = set()
+    while len(pairs) < pair_count:
+        name1, name2 = rng.sample(names, 2)
+        if (name2, name1) in pairs:
+            continue
+        pairs.add((name1, name2))
+        blacklist.add(common.NamePair(name1, name2))
+        blacklist.add(common.NamePair(name2, name1))
+    config.save()
+    config.close()
+    return pair_count
+
+
+class Runner():
+    def __init__(self, conf_name: str) -> None:
+        self.conf_name = conf_name
+        self.command = vwgen.vxWireguardCommand()
+        self.config = common.Config()
+        self.config.load(conf_name)
+
+    def run(self, argv: List[str]) -> None:
+        self.command._build_subparsers(argv)
+        args = self.command.parser.parse_args(argv)
+        args.config = self.config
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            return_value = self.command.run_sub_command(args)
+        if return_value:
+            raise RuntimeError('{} failed: {}'.format(' '.join(argv),
+                                                      os.strerror(return_value)))
+
+    def close(self) -> None:
+        self.config.close()
+
+
+def operations(runner: Runner, tmp_dir: str,
+               repeat_index: int) -> Dict[str, Callable[[], None]]:
+    conf_name = runner.conf_name
+
+    def load(cold: bool) -> Callable[[], None]:
+        def run() -> None:
+            if cold:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(conf_name + '.snapshot')
+            config = common.Config()
+            config.load(conf_name)
+            config.close()
+
+        return run
+
+    def ls_all() -> None:
+        out_dir = os.path.join(tmp_dir, 'out')
+        shutil.rmtree(out_dir, ignore_errors=True)
+        runner.run(['ls', '-i', conf_name, '--all', '--out-dir', out_dir])
+
+    return {
+        'load_cold': load(True),
+        'load_warm': load(False),
+        'save': runner.config.save,
+        'add': lambda: runner.run(['add', '-i', conf_name, '-n', 'extra']),
+        'del': lambda: runner.run(['del', '-i', conf_name, '-n', 'extra']),
+        'set': lambda: runner.run([
+            'set', '-i', conf_name, '-n', 'node1', '--listen-port',
+            str(40000 + repeat_index)
+        ]),
+        'show': lambda: runner.run(['show', '-i', conf_name]),
+        'ls': lambda: runner.run(['ls', '-i', conf_name, '-n', 'node1']),
+        'ls_all': ls_all,
+        'zone': lambda: runner.run(
+            ['zone', '-i', conf_name, '-d', 'example.com']),
+        'zone_split': lambda: runner.run([
+            'zone', '-i', conf_name, '-d', 'example.com', '--split',
+            '--out-dir',
+            os.path.join(tmp_dir, 'zones')
+        ]),
+        'export_json': lambda: runner.run(['export', '-i', conf_name, '--json']),
+        'export_toml': lambda: runner.run(['export', '-i', conf_name, '--toml']),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=REPO,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes',
+                        type=int,
+                        nargs='+',
+                        default=[10, 100, 1000, 10000])
+    parser.add_argument('--blacklist-density',
+                        type=float,
+                        default=0.001,
+                        help='fraction of node pairs that do not peer')
+    parser.add_argument('--pool-prefix',
+                        type=int,
+                        default=16,
+                        help='prefix length of the IPv4 address pool')
+    parser.add_argument('--ops',
+                        nargs='+',
+                        choices=OPERATIONS,
+                        default=OPERATIONS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output',
+                        default='',
+                        help='write the JSON here instead of stdout')
+    opts = parser.parse_args()
+    if 'del' in opts.ops and 'add' not in opts.ops:
+        parser.error('del removes the node added by add, select both')
+    opts.ops = [op for op in OPERATIONS if op in opts.ops]
+
+    pool_size = 2**(32 - opts.pool_prefix) - 2
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for node_count in opts.nodes:
+            if node_count + 1 > pool_size:
+                print('skipping {} nodes: the /{} pool has {} addresses'.format(
+                    node_count, opts.pool_prefix, pool_size),
+                      file=sys.stderr)
+                continue
+            conf_name = os.path.join(tmp_dir, 'mesh{}'.format(node_count))
+            start = time.perf_counter()
+            pair_count = build_mesh(conf_name, node_count, opts.pool_prefix,
+                                    opts.blacklist_density,
+                                    random.Random(opts.seed))
+            print('{} nodes, {} blacklisted pairs built in {:.2f} s'.format(
+                node_count, pair_count,
+                time.perf_counter() - start),
+                  file=sys.stderr)
+
+            runner = Runner(conf_name)
+            samples: Dict[str, List[float]] = {op: [] for op in opts.ops}
+            for repeat_index in range(opts.repeat):
+                ops = operations(runner, tmp_dir, repeat_index)
+                for op in opts.ops:
+                    start = time.perf_counter()
+                    ops[op]()
+                    samples[op].append(time.perf_counter() - start)
+            runner.close()
+
+            for op in opts.ops:
+                results.append({
+                    'nodes': node_count,
+                    'blacklisted_pairs': pair_count,
+                    'op': op,
+                    'runs': len(samples[op]),
+                    'min_s': min(samples[op]),
+                    'median_s': statistics.median(samples[op]),
+                    'max_s': max(samples[op]),
+                })
+                print('  {:<12} {:>10.2f} ms'.format(
+                    op,
+                    min(samples[op]) * 1000),
+                      file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'blacklist_density': opts.blacklist_density,
+            'pool_prefix': opts.pool_prefix,
+            'repeat': opts.repeat,
+            'seed': opts.seed,
+        },
+        'results': results,
+    }
+    if opts.output:
+        with open(opts.output, 'w') as output:
+            json.dump(report, output, indent=2)
+            output.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
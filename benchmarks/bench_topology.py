@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# WireGuard peers per conf, total conf size and `ls --all` render time of a
+# full mesh against the same network with --hubs set.
+#
+#   python3 benchmarks/bench_topology.py --nodes 2000 --hubs 1 3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common, showconf  # noqa: E402
+from network import build_network  # noqa: E402
+
+
+def render_all(conf_name: str, out_dir: str, hubs: List[str]) -> float:
+    config = common.Config()
+    config.load(conf_name)
+    if hubs:
+        config.network()['Hubs'] = hubs
+    else:
+        config.network().pop('Hubs', None)
+    start = time.perf_counter()
+    showconf.vw_show_conf_all(
+        argparse.Namespace(interface=[conf_name],
+                           out_dir=out_dir,
+                           jobs=1,
+                           incremental=False,
+                           config=config))
+    seconds = time.perf_counter() - start
+    config.close()
+    return seconds
+
+
+def peer_counts(out_dir: str) -> List[int]:
+    counts = []
+    for file_name in os.listdir(out_dir):
+        if file_name.endswith('.conf'):
+            with open(os.path.join(out_dir, file_name), 'r') as conf_file:
+                counts.append(sum(1 for line in conf_file
+                                  if line == '[Peer]\n'))
+    return counts
+
+
+def directory_size(out_dir: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(out_dir, i)) for i in os.listdir(out_dir))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=2000)
+    parser.add_argument('--hubs',
+                        type=int,
+                        nargs='+',
+                        default=[1, 3],
+                        help='hub counts to compare with the full mesh')
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conf_name = os.path.join(tmp_dir, 'net')
+        build_network(conf_name, opts.nodes).close()
+
+        print('nodes: {}'.format(opts.nodes))
+        print('{:<12} {:>10} {:>12} {:>10} {:>10}'.format(
+            'topology', 'max peers', 'total peers', 'conf MiB', 'render s'))
+        for hub_count in [0] + opts.hubs:
+            hubs = ['node{}'.format(i + 1) for i in range(hub_count)]
+            out_dir = os.path.join(tmp_dir, 'out{}'.format(hub_count))
+            seconds = render_all(conf_name, out_dir, hubs)
+            counts = peer_counts(out_dir)
+            print('{:<12} {:>10} {:>12} {:>10.1f} {:>10.2f}'.format(
+                '{} hubs'.format(hub_count) if hubs else 'full mesh',
+                max(counts), sum(counts),
+                directory_size(out_dir) / 1048576, seconds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+# Synthetic networks shared by the benchmarks, built through the Config API.
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import add, common  # noqa: E402
+
+
+def build_network(conf_name: str,
+                  node_count: int,
+                  pool_prefix: int = 8) -> common.Config:
+    # Nodes node1 to node<node_count>, saved. The config is returned still
+    # open, so callers can add to it before they save and close it.
+    config = common.Config()
+    config.load(conf_name)
+    config.network()['AddressPoolIPv4'] = '10.0.0.0/{}'.format(pool_prefix)
+    add.vw_add(
+        argparse.Namespace(interface=[conf_name],
+                           nodes=[],
+                           count=node_count,
+                           prefix='node',
+                           config=config))
+    return config
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str, stdin: str = '') -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          input=stdin,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+class BatchTest(unittest.TestCase):
+    def test_show_leaves_config_unchanged(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '-n', 'node1')
+            # Not canonical, so the Node keeps the string as given
+            vwgen(tmp_dir, 'set', '-i', 'net', '-n', 'node1', '--addr',
+                  '10.0.0.01/24')
+            vwgen(tmp_dir, 'set', '-i', 'net', '-n', 'node1', '--listen-port',
+                  '5000')
+            with open(os.path.join(tmp_dir, 'net.conf'), 'r') as conf_file:
+                expected = conf_file.read()
+
+            # The set rewrites the config after show ran on the same one
+            vwgen(tmp_dir,
+                  '-batch',
+                  '-',
+                  stdin='show -i net\n'
+                  'set -i net -n node1 --listen-port 5000\n')
+            with open(os.path.join(tmp_dir, 'net.conf'), 'r') as conf_file:
+                self.assertEqual(conf_file.read(), expected)
+
+    def test_concurrent_batches_creating_a_network(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = subprocess.Popen([sys.executable, VWGEN, '-batch', '-'],
+                                     cwd=tmp_dir,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.DEVNULL,
+                                     universal_newlines=True)
+            assert first.stdin is not None
+            first.stdin.write('add -i net -n node1\n')
+            first.stdin.flush()
+            # The first batch holds the lock from its first line until its
+            # input ends
+            conf_name = os.path.join(tmp_dir, 'net.conf')
+            for _ in range(100):
+                if os.path.exists(conf_name):
+                    break
+                time.sleep(0.05)
+            second = subprocess.Popen([sys.executable, VWGEN, '-batch', '-'],
+                                      cwd=tmp_dir,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL,
+                                      universal_newlines=True)
+            assert second.stdin is not None
+            second.stdin.write('add -i net -n node2\n')
+            second.stdin.close()
+            # Let the second batch reach the lock before the first commits
+            time.sleep(0.5)
+            first.communicate('')
+            second.wait()
+            self.assertEqual((first.returncode, second.returncode), (0, 0))
+
+            with open(conf_name, 'r') as conf_file:
+                conf = conf_file.read()
+            self.assertIn('[Node.node1]', conf)
+            self.assertIn('[Node.node2]', conf)
+
+    def test_rolled_back_batch_leaves_no_network(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result = subprocess.run(
+                [sys.executable, VWGEN, '-batch', '-'],
+                cwd=tmp_dir,
+                input='add -i net -n node1\ndel -i net -n missing\n',
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True)
+            self.assertNotEqual(result.returncode, 0)
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common  # noqa: E402
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+class BlacklistTest(unittest.TestCase):
+    def test_edits_keep_the_list_sorted(self) -> None:
+        blacklist = common.Blacklist([('b', 'c'), ('a', 'b')])
+        self.assertEqual(list(blacklist), [['a', 'b'], ['b', 'c']])
+
+        blacklist.add(common.NamePair('a', 'c'))
+        blacklist.add(common.NamePair('a', 'c'))
+        blacklist.add(common.NamePair('c', 'a'))
+        blacklist.remove(common.NamePair('b', 'c'))
+        self.assertEqual(list(blacklist), [['a', 'b'], ['a', 'c'],
+                                           ['c', 'a']])
+        self.assertEqual(len(blacklist), 3)
+        self.assertEqual(blacklist[1], ['a', 'c'])
+
+    def test_pairs_are_indexed_both_ways(self) -> None:
+        blacklist = common.Blacklist([('a', 'b'), ('b', 'a'), ('a', 'c'),
+                                      ('c', 'b')])
+        self.assertIn(('a', 'b'), blacklist)
+        self.assertNotIn(('b', 'c'), blacklist)
+        self.assertNotIn('a', blacklist)
+        self.assertEqual(blacklist.peers('a'), {'b', 'c'})
+        self.assertEqual(blacklist.peers('d'), set())
+
+        # Pairs naming the node on either side go
+        blacklist.remove_node('b')
+        self.assertEqual(list(blacklist), [['a', 'c']])
+        self.assertEqual(len(blacklist), 1)
+        self.assertEqual(blacklist.peers('c'), set())
+        with self.assertRaises(KeyError):
+            blacklist.remove(common.NamePair('a', 'b'))
+
+    def test_del_drops_the_pairs_of_the_node(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '3')
+            vwgen(tmp_dir, 'bl', '-i', 'net', '-l', 'node1', '-r', 'node2',
+                  'add')
+            vwgen(tmp_dir, 'bl', '-i', 'net', '-l', 'node2', '-r', 'node3',
+                  'add')
+            conf = vwgen(tmp_dir, 'ls', '-i', 'net', '-n', 'node2')
+            self.assertEqual(conf.count('#[Peer]'), 2)
+
+            vwgen(tmp_dir, 'del', '-i', 'net', '-n', 'node1')
+            config = common.Config()
+            config.load(os.path.join(tmp_dir, 'net'))
+            self.assertEqual(list(config.blacklist()),
+                             [['node2', 'node3'], ['node3', 'node2']])
+            config.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree
+
+import toml
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common, vw_export  # noqa: E402
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir = self._tmp_dir.name
+        vwgen(self.tmp_dir, 'add', '-i', 'net', '--count', '3')
+        vwgen(self.tmp_dir, 'bl', '-i', 'net', '-l', 'node1', '-r', 'node2',
+              'add')
+        config = common.Config()
+        config.load(os.path.join(self.tmp_dir, 'net'))
+        self.conf = vw_export.plain(config._conf)
+        config.close()
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def export(self, *argv: str) -> str:
+        return vwgen(self.tmp_dir, 'export', '-i', 'net', *argv)
+
+    def test_json_matches_dumps_of_the_config(self) -> None:
+        self.assertEqual(self.export('--json'), json.dumps(self.conf) + '\n')
+
+    def test_ndjson_lines_merge_into_the_json_document(self) -> None:
+        merged = {}
+        lines = self.export('--ndjson').splitlines()
+        for line in lines:
+            for key, value in json.loads(line).items():
+                if key == 'Node':
+                    merged.setdefault(key, {}).update(value)
+                else:
+                    merged[key] = value
+        self.assertEqual(merged, self.conf)
+        self.assertEqual(sum(1 for i in lines if i.startswith('{"Node"')), 3)
+
+    def test_yaml_and_toml_load_back(self) -> None:
+        self.assertEqual(yaml.safe_load(self.export('--yaml')), self.conf)
+        self.assertEqual(toml.loads(self.export('--toml')), self.conf)
+        with open(os.path.join(self.tmp_dir, 'net.conf'), 'r') as conf_file:
+            self.assertEqual(self.export('--toml'), conf_file.read())
+
+    def test_xml_has_every_node(self) -> None:
+        root = xml.etree.ElementTree.fromstring(self.export('--xml'))
+        self.assertEqual([i.tag for i in root.find('Node')],
+                         ['node1', 'node2', 'node3'])
+
+    def test_output_file_is_private(self) -> None:
+        self.assertEqual(self.export('--json', '--output', 'out.json'), '')
+        out_name = os.path.join(self.tmp_dir, 'out.json')
+        self.assertEqual(stat.S_IMODE(os.stat(out_name).st_mode), 0o600)
+        with open(out_name, 'r') as out_file:
+            self.assertEqual(json.load(out_file), self.conf)
+
+
+if __name__ == '__main__':
+    unittest.main()
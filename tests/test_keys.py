@@ -0,0 +1,44 @@
+import os
+import select
+import subprocess
+import sys
+import unittest
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+class PubTest(unittest.TestCase):
+    def test_pub_answers_each_key_before_input_ends(self) -> None:
+        pairs = subprocess.run([sys.executable, VWGEN, 'key', '--count', '2',
+                                '--with-pub'],
+                               stdout=subprocess.PIPE,
+                               universal_newlines=True,
+                               check=True).stdout.splitlines()
+        # Buffered as it is by default
+        env = dict(os.environ)
+        env.pop('PYTHONUNBUFFERED', None)
+        pub = subprocess.Popen([sys.executable, VWGEN, 'pub'],
+                               env=env,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               universal_newlines=True)
+        assert pub.stdin is not None and pub.stdout is not None
+        try:
+            # A co-process writes one key and waits for its public key
+            for pair in pairs:
+                private_key, public_key = pair.split(' ')
+                pub.stdin.write(private_key + '\n')
+                pub.stdin.flush()
+                readable, _, _ = select.select([pub.stdout], [], [], 10)
+                self.assertTrue(readable, 'pub did not answer')
+                self.assertEqual(pub.stdout.readline(), public_key + '\n')
+        finally:
+            pub.stdin.close()
+            pub.wait(timeout=10)
+            pub.stdout.close()
+        self.assertEqual(pub.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import pickle
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common  # noqa: E402
+
+
+class NodeTest(unittest.TestCase):
+    def test_arrays_read_back_as_tuples(self) -> None:
+        node = common.Node({
+            'Address': ['10.0.0.1/24'],
+            'AllowedIPs': ['10.0.0.01/32'],
+            'PreUp': ['true'],
+        })
+        # Packed, kept as given and plain fields all behave the same
+        for key in ('Address', 'AllowedIPs', 'PreUp'):
+            self.assertIsInstance(node[key], tuple)
+            with self.assertRaises(AttributeError):
+                node[key].append('1.1.1.1')
+
+        node['Address'] = list(node['Address']) + ['1.1.1.1']
+        self.assertEqual(node['Address'], ('10.0.0.1/24', '1.1.1.1'))
+
+    def test_items_are_copies(self) -> None:
+        node = common.Node({'Address': ['10.0.0.1/24'], 'ListenPort': 1})
+        items = node.items()
+        items.clear()
+        self.assertEqual(node.items(), [('Address', ('10.0.0.1/24', )),
+                                        ('ListenPort', 1)])
+
+    def test_items_follow_changes(self) -> None:
+        node = common.Node({'ListenPort': 1})
+        node.items()
+        node['ListenPort'] = 2
+        node['Endpoint'] = None
+        self.assertEqual(node.items(), [('ListenPort', 2)])
+        node = pickle.loads(pickle.dumps(node))
+        self.assertEqual(node.items(), [('ListenPort', 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
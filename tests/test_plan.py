@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import plan  # noqa: E402
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str, check: bool = True) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL,
+                          universal_newlines=True,
+                          check=check).stdout
+
+
+PEER = 'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA='
+CONF = '''[Interface]
+ListenPort = 1000
+PreUp = ip link add v%i mtu 1500 type vxlan id 1 dstport 4789 ttl 1 noudpcsum || true
+PreUp = ip address add 10.0.0.1/24 dev v%i || true
+PostUp = bridge fdb append 00:00:00:00:00:00 dev v%i dst 169.254.0.2 via %i
+
+[Peer]
+PublicKey = {}
+AllowedIPs = 169.254.0.2/32
+Endpoint = 192.0.2.2:1000
+'''.format(PEER)
+
+
+def plan_for(old_conf: str, conf: str) -> List[List[str]]:
+    return list(
+        plan.plan_commands('wg0', plan.parse_conf(old_conf),
+                           plan.parse_conf(conf)))
+
+
+class PlanCommandsTest(unittest.TestCase):
+    def test_unchanged_conf_plans_nothing(self) -> None:
+        self.assertEqual(plan_for(CONF, CONF), [[], []])
+
+    def test_removals_go_first(self) -> None:
+        conf = CONF.replace('10.0.0.1/24', '10.0.0.9/24').replace(
+            '169.254.0.2 via', '169.254.0.3 via')
+        commands, restart = plan_for(CONF, conf)
+        self.assertEqual(commands, [
+            'bridge fdb del 00:00:00:00:00:00 dev vwg0 dst 169.254.0.2',
+            'ip address del 10.0.0.1/24 dev vwg0',
+            'ip address add 10.0.0.9/24 dev vwg0',
+            'bridge fdb append 00:00:00:00:00:00 dev vwg0 dst 169.254.0.3 '
+            'via wg0',
+        ])
+        self.assertEqual(restart, [])
+
+    def test_forgotten_endpoint_adds_the_peer_afresh(self) -> None:
+        conf = CONF.replace('Endpoint = 192.0.2.2:1000\n', '')
+        commands, _ = plan_for(CONF, conf)
+        self.assertEqual(commands, [
+            'wg set wg0 peer {} remove'.format(PEER),
+            'wg set wg0 peer {} allowed-ips 169.254.0.2/32'.format(PEER),
+        ])
+
+    def test_vxlan_id_change_needs_a_restart(self) -> None:
+        commands, restart = plan_for(CONF, CONF.replace(' id 1 ', ' id 2 '))
+        self.assertEqual(commands, [])
+        self.assertEqual(restart, ['The VXLAN id or port'])
+
+
+class PlanTest(unittest.TestCase):
+    def test_plan_records_what_it_applied(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '3')
+            with open(os.path.join(tmp_dir, 'running.conf'), 'w') as out:
+                out.write(vwgen(tmp_dir, 'ls', '-i', 'net', '-n', 'node1'))
+            # Nothing to diff against yet
+            self.assertEqual(vwgen(tmp_dir, 'plan', '-i', 'net', '-n',
+                                   'node1', check=False), '')
+            self.assertEqual(
+                vwgen(tmp_dir, 'plan', '-i', 'net', '-n', 'node1', '--from',
+                      'running.conf'), '')
+
+            vwgen(tmp_dir, 'set', '-i', 'net', '-n', 'node1', '--listen-port',
+                  '5000')
+            expected = 'wg set net listen-port 5000\n'
+            self.assertEqual(
+                vwgen(tmp_dir, 'plan', '-i', 'net', '-n', 'node1',
+                      '--dry-run'), expected)
+            self.assertEqual(vwgen(tmp_dir, 'plan', '-i', 'net', '-n', 'node1'),
+                             expected)
+            self.assertEqual(vwgen(tmp_dir, 'plan', '-i', 'net', '-n', 'node1'),
+                             '')
+
+
+if __name__ == '__main__':
+    unittest.main()
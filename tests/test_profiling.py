@@ -0,0 +1,39 @@
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stderr
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api.profiling import Profiler  # noqa: E402
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_start_resets_previous_run(self) -> None:
+        profiler = Profiler()
+        profiler.start()
+        with profiler.phase('first'):
+            profiler.count('events')
+        profiler.enabled = False
+
+        profiler.start()
+        with profiler.phase('second'):
+            pass
+        out = io.StringIO()
+        profiler.report(out=out)
+        self.assertIn('second', out.getvalue())
+        self.assertNotIn('first', out.getvalue())
+        self.assertNotIn('events', out.getvalue())
+
+    def test_report_writes_to_current_stderr(self) -> None:
+        profiler = Profiler()
+        profiler.start()
+        err = io.StringIO()
+        with redirect_stderr(err):
+            profiler.report()
+        self.assertIn('vwgen: profile', err.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+class PubkeyCacheTest(unittest.TestCase):
+    def test_sidecar_is_private(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '2')
+            vwgen(tmp_dir, 'ls', '-i', 'net', '-n', 'node1')
+            mode = os.stat(os.path.join(tmp_dir, 'net.pubkey')).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0o600)
+
+    def test_writable_sidecar_is_not_trusted(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '2')
+            expected = vwgen(tmp_dir, 'ls', '-i', 'net', '-n', 'node1')
+
+            # Every entry claims the same, wrong public key
+            sidecar = os.path.join(tmp_dir, 'net.pubkey')
+            with open(sidecar, 'r') as cache_file:
+                lines = cache_file.read().splitlines()
+            self.assertTrue(lines)
+            with open(sidecar, 'w') as cache_file:
+                for line in lines:
+                    cache_file.write(line.split(' ')[0] + ' ' +
+                                     'A' * 43 + '=\n')
+            os.chmod(sidecar, 0o666)
+
+            self.assertEqual(vwgen(tmp_dir, 'ls', '-i', 'net', '-n', 'node1'),
+                             expected)
+            self.assertEqual(stat.S_IMODE(os.stat(sidecar).st_mode), 0o600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+class BatchDirTest(unittest.TestCase):
+    def test_hooks_go_on_past_failing_lines(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '3')
+            vwgen(tmp_dir, 'ls', '-i', 'net', '--all', '--out-dir', 'out',
+                  '--batch-dir', '/etc/wireguard/net')
+            with open(os.path.join(tmp_dir, 'out', 'node1.conf'),
+                      'r') as conf_file:
+                hooks = [
+                    line for line in conf_file.read().splitlines()
+                    if '-batch' in line
+                ]
+            self.assertEqual(len(hooks), 2)
+            for hook in hooks:
+                self.assertRegex(hook, r'\| (ip|bridge) -force -batch -')
+            with open(os.path.join(tmp_dir, 'out', 'node1.bridge'),
+                      'r') as bridge_file:
+                self.assertEqual(len(bridge_file.read().splitlines()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
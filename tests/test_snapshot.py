@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from api import common, vw_export  # noqa: E402
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+def load(conf_name: str) -> object:
+    config = common.Config()
+    config.load(conf_name)
+    conf = vw_export.plain(config._conf)
+    config.close()
+    return conf
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_warm_load_equals_cold_load(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # add leaves Endpoint = None in memory, which TOML cannot hold
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '3')
+            vwgen(tmp_dir, 'bl', '-i', 'net', '-l', 'node1', '-r', 'node2',
+                  'add')
+            conf_name = os.path.join(tmp_dir, 'net')
+            self.assertTrue(os.path.exists(conf_name + '.snapshot'))
+            warm = load(conf_name)
+            os.unlink(conf_name + '.snapshot')
+            self.assertEqual(warm, load(conf_name))
+
+    def test_incremental_render_survives_snapshot_loss(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '3')
+            vwgen(tmp_dir, 'ls', '-i', 'net', '--all', '--out-dir', 'out')
+            os.unlink(os.path.join(tmp_dir, 'net.snapshot'))
+            self.assertEqual(
+                vwgen(tmp_dir, 'ls', '-i', 'net', '--all', '--out-dir', 'out',
+                      '--incremental'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from vwgen import vxWireguardCommand  # noqa: E402
+
+
+class FindSubcommandTest(unittest.TestCase):
+    def test_skips_global_option_values(self) -> None:
+        find = vxWireguardCommand._find_subcommand
+        self.assertIsNone(find(['--parallel', '2', '-batch', 'commands']))
+        self.assertEqual(find(['--profile-dir', 'prof', 'show', '-i', 'net']),
+                         'show')
+        self.assertEqual(
+            find(['--config', 'vwgen.toml', '--connect', 'sock', 'ls']), 'ls')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from typing import List
+
+VWGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                     'vwgen.py')
+
+
+def vwgen(cwd: str, *argv: str) -> str:
+    return subprocess.run([sys.executable, VWGEN] + list(argv),
+                          cwd=cwd,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True,
+                          check=True).stdout
+
+
+def changes(output: str) -> List[List[str]]:
+    # [action, owner, type] of each line of --ixfr output
+    return [
+        [line.split()[0], line.split()[1], line.split()[4]]
+        for line in output.splitlines() if line.startswith(('add ', 'del '))
+    ]
+
+
+class ZoneStateTest(unittest.TestCase):
+    def test_full_zone_keeps_no_state(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '2')
+            vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com')
+            self.assertEqual(
+                [i for i in os.listdir(tmp_dir) if 'zone-' in i], [])
+
+    def test_ixfr_after_other_runs(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '2')
+            vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com', '--ixfr')
+            # Neither of these changes what the next --ixfr diffs against
+            vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com')
+            vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                  '--split', '--out-dir', 'zones')
+            vwgen(tmp_dir, 'add', '-i', 'net', '-n', 'node3')
+
+            diff = changes(
+                vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                      '--ixfr'))
+            self.assertEqual(diff[:2], [['del', 'example.com.', 'SOA'],
+                                        ['add', 'example.com.', 'SOA']])
+            self.assertEqual([i[2] for i in diff[2:]],
+                             ['A', 'AAAA', 'PTR', 'PTR'])
+            self.assertEqual({i[0] for i in diff[2:]}, {'add'})
+
+            self.assertEqual(
+                changes(
+                    vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                          '--ixfr')), [])
+
+    def test_nsupdate_emits_only_changes(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '2')
+            first = vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                          '--nsupdate', '--server', '192.0.2.1')
+            self.assertIn('server 192.0.2.1\nzone example.com.\n', first)
+            self.assertEqual(first.count('update add '), 8)
+            self.assertNotIn('update delete ', first)
+
+            vwgen(tmp_dir, 'del', '-i', 'net', '-n', 'node2')
+            second = vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                           '--nsupdate')
+            updates = [i for i in second.splitlines() if i.startswith('update')]
+            self.assertEqual(len(updates), 4)
+            for update in updates:
+                self.assertTrue(update.startswith('update delete '))
+                self.assertIn('node2.example.com.', update)
+            # Each reverse owner is its own message, nsupdate finds its zone
+            self.assertEqual(second.count('send'), 3)
+
+    def test_split_writes_changed_zones_only(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            vwgen(tmp_dir, 'add', '-i', 'net', '--count', '2')
+            listed = vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                           '--split', '--out-dir', 'zones').splitlines()
+            self.assertEqual(len(listed), 3)
+            self.assertEqual(listed[0], 'example.com')
+            self.assertTrue(listed[1].endswith('.in-addr.arpa'))
+            self.assertTrue(listed[2].endswith('.ip6.arpa'))
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp_dir, 'zones'))),
+                             sorted(i + '.zone' for i in listed))
+            with open(os.path.join(tmp_dir, 'zones', 'example.com.zone'),
+                      'r') as zone_file:
+                forward = zone_file.read()
+            self.assertIn('NS      ns1.example.com.', forward)
+            self.assertNotIn('PTR', forward)
+
+            self.assertEqual(
+                vwgen(tmp_dir, 'zone', '-i', 'net', '-d', 'example.com',
+                      '--split', '--out-dir', 'zones'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,13 @@
 # !/usr/bin/env python3
 
+import errno
+import io
+import os
 import sys
 import argparse
-import subprocess
-from pathlib import Path
 from api import batch
-from api import genkey, genpsk, pubkey
-from api import common
-from api import add, show, zone, vw_set, vw_del, showconf, blacklist, vw_export
-from typing import Dict
+from api.profiling import profiler
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 
 NORMAL = '\x1b[0m'
@@ -18,14 +17,46 @@ YELLOW = '\x1b[33m'
 
 
 class vxWireguardCommand():
+    # Global options taking a value, which must not be mistaken for the
+    # subcommand name
+    GLOBAL_OPTIONS_WITH_VALUE = ('--config', '-batch', '--connect', '--parallel',
+                                 '--profile-dir')
+
     def __init__(self):
         self.parser = argparse.ArgumentParser()
         self.subcmd = self.parser.add_subparsers(dest='subcmd',
                                                  help='subcommands',
                                                  metavar='SUBCOMMAND')
         self.parser.add_argument("--config", default="", dest='config', help='config class')
+        self.parser.add_argument('--cache-stats',
+                                 action='store_true',
+                                 dest='cache_stats',
+                                 help='Report public key cache hit rate')
+        self.parser.add_argument(
+            '--connect',
+            default='',
+            dest='connect',
+            help='Run the command in the `vwgen serve` listening on SOCKET '
+            '(Default: $VWGEN_SOCKET)',
+            metavar='SOCKET')
+        self.parser.add_argument(
+            '--profile',
+            action='store_true',
+            dest='profile',
+            help='Report time per phase, lock waits, public key derivations and '
+            'peak memory on stderr')
+        self.parser.add_argument(
+            '--profile-dir',
+            default='',
+            dest='profile_dir',
+            help='Also write a cProfile file per subcommand or batch line to DIR '
+            '(implies --profile)',
+            metavar='DIR')
 
         # self.subcmd.required = True
+        self._config_cache = None
+        self._profile_dir = ''
+        self._build_parser()
 
     def __build_parser_add(self):
         # subCommand: add
@@ -39,6 +70,16 @@ class vxWireguardCommand():
                                 dest='nodes',
                                 help='new node user name',
                                 action='append')
+        add_parser.add_argument('--count',
+                                type=int,
+                                default=0,
+                                dest='count',
+                                help='Add N nodes named <prefix>1, <prefix>2, ...')
+        add_parser.add_argument('--prefix',
+                                type=str,
+                                default='node',
+                                dest='prefix',
+                                help='Name prefix for --count (Default: node)')
         add_parser.add_argument('-i',
                                 '--interface',
                                 dest='interface',
@@ -63,6 +104,12 @@ class vxWireguardCommand():
         set_parser.add_argument('--vxlan-id', dest='vxlan_id', type=str, help='Vxlan id')
         set_parser.add_argument('--vxlan-mtu', dest='vxlan_mtu', type=str, help='Vxlan MTU')
         set_parser.add_argument('--vxlan-port', dest='vxlan_port', type=str, help='Vxlan port')
+        set_parser.add_argument('--hubs',
+                                dest='hubs',
+                                type=str,
+                                help='Nodes that relay between all others, '
+                                'which then only peer with them (off for a '
+                                'full mesh)')
         set_parser.add_argument('--addr', dest='addr', type=str, help='Address')
         set_parser.add_argument('--allowed-ips', dest='all_ips', type=str, help='Allowed IP')
         set_parser.add_argument('--endpoint', dest='endpoint', type=str, help='Endpoint')
@@ -127,6 +174,59 @@ class vxWireguardCommand():
                                 required=True,
                                 help='domain suffix',
                                 action='append')
+        del_parser.add_argument(
+            '--nsupdate',
+            action='store_true',
+            dest='nsupdate',
+            help='Print the changes since the last run as an nsupdate script')
+        del_parser.add_argument(
+            '--ixfr',
+            action='store_true',
+            dest='ixfr',
+            help='Print the changes since the last run as an IXFR-style diff')
+        del_parser.add_argument('--server',
+                                default='',
+                                dest='server',
+                                help='name server for the nsupdate script')
+        del_parser.add_argument(
+            '--split',
+            action='store_true',
+            dest='split',
+            help='Separate forward, in-addr.arpa and ip6.arpa zones')
+        del_parser.add_argument('--out-dir',
+                                default='',
+                                dest='out_dir',
+                                help='directory for the --split zone files')
+
+    def __build_parser_plan(self):
+        # subCommand: plan
+        plan_parser = self.subcmd.add_parser(
+            'plan',
+            help='Print the commands that apply node changes to its running '
+            'interface')
+        plan_parser.add_argument('-i',
+                                 '--interface',
+                                 dest='interface',
+                                 required=True,
+                                 help='network-interface name',
+                                 action='append')
+        plan_parser.add_argument('-n',
+                                 '--node',
+                                 type=str,
+                                 dest='node',
+                                 required=True,
+                                 help='node name')
+        plan_parser.add_argument(
+            '--from',
+            type=str,
+            dest='from_conf',
+            default='',
+            help='conf the interface runs (Default: the last planned conf)')
+        plan_parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Do not record the plan as applied')
 
     def __build_parser_show(self):
         # subCommand: show
@@ -142,6 +242,16 @@ class vxWireguardCommand():
         # subCommand: genkey
         genkey_parser = self.subcmd.add_parser(
             'key', help='Generates a new private key and writes it to stdout')
+        genkey_parser.add_argument('--count',
+                                   type=int,
+                                   default=1,
+                                   dest='count',
+                                   help='Generate N private keys, one per line')
+        genkey_parser.add_argument('--with-pub',
+                                   dest='with_pub',
+                                   action='store_true',
+                                   help='Follow each private key with its '
+                                   'public key on the same line')
 
     def __build_parser_genpsk(self):
         # subCommand: genpsk
@@ -154,7 +264,8 @@ class vxWireguardCommand():
         pubkey_parser = self.subcmd.add_parser(
             'pub',
             help=
-            'Reads a private key from stdin and writes a public key to stdout')
+            'Reads private keys from stdin, one per line, and writes their '
+            'public keys to stdout')
 
     def __build_parser_export(self):
         # subCommand: export
@@ -182,6 +293,16 @@ class vxWireguardCommand():
                                    action='store_true',
                                    dest='json',
                                    help='Export config file (json)')
+        export_parser.add_argument(
+            '--ndjson',
+            action='store_true',
+            dest='ndjson',
+            help='Export config file (json, one line per node)')
+        export_parser.add_argument('-o',
+                                   '--output',
+                                   default='',
+                                   dest='output',
+                                   help='Write the export to a file')
 
     def __build_parser_blacklist(self):
         # subCommand: blacklist
@@ -206,9 +327,32 @@ class vxWireguardCommand():
     def __build_parser_batch(self):
         # subCommand: batch        
 
-        self.parser.add_argument("-batch", default="", dest='batch', help='Read commands from provided file or standard input and invoke them.')
+        self.parser.add_argument("-batch", default="", dest='batch', help='Read commands from provided file or standard input (-) and invoke them.')
+        self.parser.add_argument('--no-transaction',
+                                 action='store_true',
+                                 dest='no_transaction',
+                                 help='Save the config after every batch line instead of once at the end')
+        self.parser.add_argument(
+            '--parallel',
+            type=int,
+            default=1,
+            dest='parallel',
+            help='Run the batch lines of independent interfaces in N processes, '
+            '0 for one per CPU (Default: 1)',
+            metavar='N')
+
 
 
+    def __build_parser_serve(self):
+        # subCommand: serve
+        serve_parser = self.subcmd.add_parser(
+            'serve',
+            help='Keep networks loaded and run commands sent over a Unix socket')
+        serve_parser.add_argument('-s',
+                                  '--socket',
+                                  default='vwgen.sock',
+                                  dest='socket',
+                                  help='Socket path (Default: vwgen.sock)')
 
     def __build_parser_show_conf(self):
         # subCommand: showconf
@@ -231,78 +375,372 @@ class vxWireguardCommand():
             action='store_true',
             dest='qr_printable',
             help='Show info about a node(Default: False)')
+        show_conf_parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all_nodes',
+            help='Render the conf of every node (requires --out-dir)')
+        show_conf_parser.add_argument('--out-dir',
+                                      type=str,
+                                      dest='out_dir',
+                                      default='',
+                                      help='Write <node>.conf files to DIR')
+        show_conf_parser.add_argument(
+            '-j',
+            '--jobs',
+            type=int,
+            dest='jobs',
+            default=1,
+            help='Render with N worker processes, 0 for one per CPU (Default: 1)')
+        show_conf_parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            help='Only rewrite confs whose inputs changed and print their nodes')
+        show_conf_parser.add_argument(
+            '--batch-dir',
+            type=str,
+            dest='batch_dir',
+            default='',
+            help='Bring up the VXLAN device with one ip -batch and one bridge '
+            '-batch, from <node>.ip and <node>.bridge that are written to '
+            '--out-dir and installed in BATCH_DIR on the node')
 
     def _build_parser(self):
 
-        self.__build_parser_add()
-        self.__build_parser_set()
-        self.__build_parser_del()
-        self.__build_parser_show()
-        self.__build_parser_zone()
         self.__build_parser_batch()
-        self.__build_parser_genkey()
-        self.__build_parser_genpsk()
-        self.__build_parser_pubkey()
-        self.__build_parser_export()
-        self.__build_parser_blacklist()
-        self.__build_parser_show_conf()
+        self._subparser_builders = {
+            'add': self.__build_parser_add,
+            'set': self.__build_parser_set,
+            'del': self.__build_parser_del,
+            'show': self.__build_parser_show,
+            'zone': self.__build_parser_zone,
+            'plan': self.__build_parser_plan,
+            'key': self.__build_parser_genkey,
+            'psk': self.__build_parser_genpsk,
+            'pub': self.__build_parser_pubkey,
+            'export': self.__build_parser_export,
+            'bl': self.__build_parser_blacklist,
+            'ls': self.__build_parser_show_conf,
+            'serve': self.__build_parser_serve,
+        }
+        self._built_subparsers = set()
+
+    def _build_subparsers(self, argv: List[str]):
+        # Only the subparser named on the command line is built. Help and
+        # unknown names get all of them, so the usual listing and errors
+        # are printed.
+        name = self._find_subcommand(argv)
+        if name in self._built_subparsers:
+            return
+        if name in self._subparser_builders:
+            names = [name]
+        elif name is None and '-h' not in argv and '--help' not in argv:
+            return
+        else:
+            names = list(self._subparser_builders)
+        for name in names:
+            if name not in self._built_subparsers:
+                self._subparser_builders[name]()
+                self._built_subparsers.add(name)
 
+    @classmethod
+    def _find_subcommand(cls, argv: List[str]) -> Optional[str]:
+        skip = False
+        for arg in argv:
+            if skip:
+                skip = False
+            elif arg in cls.GLOBAL_OPTIONS_WITH_VALUE:
+                skip = True
+            elif not arg.startswith('-'):
+                return arg
+        return None
 
-    def parser_sub_command(self):
-        self._build_parser()
+
+    def parser_sub_command(self, argv: Optional[List[str]] = None,
+                           config_cache: Optional[Dict[str, Any]] = None) -> int:
+        # config_cache keeps configs loaded between calls, for `vwgen serve`
+        if argv is None:
+            argv = sys.argv[1:]
+        self._config_cache = config_cache
+        self._build_subparsers(argv)
         # conf_map = Dict[str, common.Config()]
         conf_map = {}
-        args = self.parser.parse_args()
+        args = self.parser.parse_args(argv)
+        cache_stats = args.cache_stats
+        profile = args.profile or bool(args.profile_dir)
+        self._profile_dir = args.profile_dir
+        if profile:
+            # tracemalloc slows everything down, compare phases with each
+            # other rather than with unprofiled runs
+            import tracemalloc
+            tracemalloc.start()
+            profiler.start()
+            if self._profile_dir:
+                os.makedirs(self._profile_dir, exist_ok=True)
+        # A batch runs as one transaction unless --no-transaction is given
+        transactional = bool(args.batch) and not args.no_transaction
+        exit_code = 0
 
+        batch_file = None
         if args.batch:
-            command_list: list(str) = batch.load(args.batch)
+            batch_file = batch.open_batch(args.batch)
+            if batch_file is None:
+                print("vwgen: Unable to find batch file '{}'".format(args.batch), file=sys.stderr)
+                return errno.ENOENT
+            # Lines run as they are read, unless they have to be grouped first
+            command_list = batch.iter_lines(batch_file)
+            groups = []
+            if args.parallel != 1:
+                command_list = list(command_list)
+                groups = batch.partition(command_list)
         else:
             command_list: list(str) = [None]
-        for index, sentence in enumerate(command_list):
+            groups = []
+
+        if len(groups) > 1:
+            failed = self._run_groups(groups, args.parallel, conf_map, transactional)
+        else:
+            failed, exit_code = self._run_lines(enumerate(command_list), argv, conf_map, transactional)
+        if batch_file is not None and batch_file is not sys.stdin:
+            batch_file.close()
+
+        if transactional:
+            for config in conf_map.values():
+                with profiler.phase('config.commit'):
+                    if failed:
+                        config.rollback()
+                    else:
+                        config.commit()
+            if failed:
+                print('vwgen: Batch aborted, no changes were saved', file=sys.stderr)
+
+        for config in conf_map.values():
+            config.close()
+        if config_cache is not None:
+            for name in conf_map:
+                # A failed command may have left changes in memory only
+                if failed or exit_code:
+                    config_cache.pop(name, None)
+                else:
+                    config_cache[name] = conf_map[name]
+
+        if cache_stats:
+            from api import common
+            cache = common.pubkey_cache
+            print('vwgen: pubkey cache: {} hits, {} misses ({:.1%} hit rate)'.format(
+                cache.hits, cache.misses, cache.hit_rate()),
+                  file=sys.stderr)
+        if profile:
+            profiler.report(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            profiler.enabled = False
+        return 1 if failed else exit_code
+
+    def _run_lines(self, lines: Iterable[Tuple[int, Optional[str]]], argv: List[str],
+                   conf_map: Dict[str, Any], transactional: bool) -> Tuple[bool, int]:
+        failed = False
+        exit_code = 0
+        for index, sentence in lines:
             try:
                 if sentence == None:
-                    args = self.parser.parse_args()
+                    args = self.parser.parse_args(argv)
                 else:
-                    args = self.parser.parse_args(sentence.split())
+                    tokens = batch.split(sentence)
+                    if not tokens:
+                        # comment line
+                        continue
+                    self._build_subparsers(tokens)
+                    args = self.parser.parse_args(tokens)
                 if args.subcmd:
-                    if args.interface[0] in conf_map:
-                        config = conf_map[args.interface[0]]
-                    else:
-                        config = common.Config()
-                        config.load(args.interface[0])
-                        conf_map[args.interface[0]] = config
-
-                    args.config = config
-                    if args.subcmd == 'add':
-                        add.vw_add(args)
-                    elif args.subcmd == 'del':
-                        vw_del.vw_del(args)
-                    elif args.subcmd == 'set':
-                        vw_set.vw_set(args)
-                    elif args.subcmd == 'show':
-                        show.vw_show(args)
-                    elif args.subcmd == 'key':
-                        genkey.vw_genkey()
-                    elif args.subcmd == 'psk':
-                        genpsk.vw_genpsk()
-                    elif args.subcmd == 'pub':
-                        pubkey.vw_pubkey()
-                    elif args.subcmd == 'bl':
-                        blacklist.vw_blacklist(args)
-                    elif args.subcmd == 'ls':
-                        if args.nodes == []:
-                            show.vw_show(args)
-                        else:
-                            showconf.vw_show_conf(args)
-                    elif args.subcmd == 'export':
-                        vw_export.vw_export(args)
-                    elif args.subcmd == 'zone':
-                        zone.vw_zone(args)
-            except Exception as e:
+                    # Key commands do not work on a network
+                    if args.subcmd not in ('key', 'psk', 'pub', 'serve'):
+                        with profiler.phase('config.load'):
+                            args.config = self._get_config(args.interface[0], conf_map, transactional)
+                    with profiler.phase('command.' + args.subcmd):
+                        return_value = self._run_profiled(args, index)
+                    if return_value and sentence is not None:
+                        raise RuntimeError("'{}' failed: {}".format(sentence, os.strerror(return_value)))
+                    exit_code = return_value or exit_code
+            except (Exception, SystemExit) as e:
                 print("\n", e)
                 print("\n{0}Error: {1}{2}Found an error on the {3} line.{1}\n".format(BOLD, NORMAL, YELLOW, index+1))
+                failed = True
+                if transactional:
+                    break
+            finally:
+                if sentence is not None:
+                    # Whoever feeds the batch sees each result right away
+                    sys.stdout.flush()
+        return failed, exit_code
+
+    def _run_profiled(self, args, index):
+        # With --profile-dir every subcommand or batch line gets its own
+        # cProfile file, <line>-<subcommand>.prof
+        if not self._profile_dir:
+            return self.run_sub_command(args)
+        import cProfile
+        line_profile = cProfile.Profile()
+        line_profile.enable()
+        try:
+            return self.run_sub_command(args)
+        finally:
+            line_profile.disable()
+            line_profile.dump_stats(os.path.join(
+                self._profile_dir, '{:04d}-{}.prof'.format(index + 1, args.subcmd)))
+
+    def _run_groups(self, groups: List[List[Tuple[int, str]]], jobs: int,
+                    conf_map: Dict[str, Any], transactional: bool) -> bool:
+        # Groups share no interface, so they run in parallel. Each worker
+        # returns its output, which is printed group by group in batch order.
+        import concurrent.futures
+        from api import common
+        group_configs = []
+        for group in groups:
+            configs = {}
+            if transactional:
+                # Lock every network up front, workers get a copy of the
+                # config and hand back their changes
+                for _, sentence in group:
+                    for name in batch.interfaces(sentence)[:1]:
+                        configs[name] = self._get_config(name, conf_map, transactional)
+            group_configs.append(configs)
+
+        jobs = jobs or os.cpu_count() or 1
+        failed_names = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(groups))) as executor:
+            futures = [
+                executor.submit(_run_batch_group, group, configs, transactional)
+                for group, configs in zip(groups, group_configs)
+            ]
+            for group, configs, future in zip(groups, group_configs, futures):
+                group_failed, out, err, changes, keys = future.result()
+                sys.stdout.write(out)
+                sys.stderr.write(err)
+                sys.stdout.flush()
+                sys.stderr.flush()
+                for name, (conf, dirty) in changes.items():
+                    configs[name]._conf = conf
+                    configs[name]._dirty = dirty
+                    configs[name].invalidate_allocators()
+                common.pubkey_cache.add_known_keys(keys)
+                if group_failed:
+                    names = sorted({name for _, sentence in group for name in batch.interfaces(sentence)})
+                    failed_names.append(', '.join(names) or '(no interface)')
+        if failed_names:
+            print('vwgen: Batch failed for {} of {} interface groups: {}'.format(
+                len(failed_names), len(groups), '; '.join(failed_names)),
+                  file=sys.stderr)
+        return bool(failed_names)
+
+    def _get_config(self, network_name, conf_map, transactional):
+        from api import common
+        if network_name in conf_map:
+            return conf_map[network_name]
+        config = None
+        if self._config_cache is not None:
+            config = self._config_cache.get(network_name)
+            if config is not None and config.changed_on_disk():
+                config = None
+        if config is None:
+            config = common.Config()
+            config.load(network_name)
+        if transactional:
+            config.begin()
+        conf_map[network_name] = config
+        return config
+
+    def run_sub_command(self, args):
+        # Modules are imported by the subcommand using them, so a single
+        # command does not pay for the dependencies of all the others
+        if args.subcmd == 'add':
+            from api import add
+            return add.vw_add(args)
+        elif args.subcmd == 'del':
+            from api import vw_del
+            return vw_del.vw_del(args)
+        elif args.subcmd == 'set':
+            from api import vw_set
+            return vw_set.vw_set(args)
+        elif args.subcmd == 'show':
+            from api import show
+            return show.vw_show(args)
+        elif args.subcmd == 'key':
+            from api import genkey
+            return genkey.vw_genkey(args.count, args.with_pub)
+        elif args.subcmd == 'psk':
+            from api import genpsk
+            return genpsk.vw_genpsk()
+        elif args.subcmd == 'pub':
+            from api import pubkey
+            return pubkey.vw_pubkey()
+        elif args.subcmd == 'bl':
+            from api import blacklist
+            return blacklist.vw_blacklist(args)
+        elif args.subcmd == 'ls':
+            if args.all_nodes:
+                from api import showconf
+                return showconf.vw_show_conf_all(args)
+            elif args.nodes == []:
+                from api import show
+                return show.vw_show(args)
+            else:
+                from api import showconf
+                return showconf.vw_show_conf(args)
+        elif args.subcmd == 'export':
+            from api import vw_export
+            return vw_export.vw_export(args)
+        elif args.subcmd == 'zone':
+            from api import zone
+            return zone.vw_zone(args)
+        elif args.subcmd == 'plan':
+            from api import plan
+            return plan.vw_plan(args)
+        elif args.subcmd == 'serve':
+            if self._config_cache is not None:
+                print('vwgen: Already running in `vwgen serve`', file=sys.stderr)
+                return errno.EINVAL
+            from api import serve
+            return serve.vw_serve(args, self.parser_sub_command)
+
+
+def _run_batch_group(group: List[Tuple[int, str]], configs: Dict[str, Any],
+                     transactional: bool) -> Tuple[bool, str, str, Dict[str, Any], Dict[bytes, bytes]]:
+    # Runs in a worker process of vxWireguardCommand._run_groups()
+    from api import common
+    command = vxWireguardCommand()
+    conf_map = dict(configs)
+    saved = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+    try:
+        failed, _ = command._run_lines(group, [], conf_map, transactional)
+        if not transactional:
+            for config in conf_map.values():
+                config.close()
+        out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+    finally:
+        sys.stdout, sys.stderr = saved
+    changes = {}
+    if transactional:
+        changes = {name: (config._conf, config._dirty) for name, config in conf_map.items()}
+    return failed, out, err, changes, common.pubkey_cache.known_keys()
 
 
 if __name__ == '__main__':
+    # Hand the command to a running `vwgen serve` if one is configured
+    argv = sys.argv[1:]
+    socket_path = os.environ.get('VWGEN_SOCKET', '')
+    for index, arg in enumerate(argv):
+        if arg == '--connect' and index + 1 < len(argv):
+            socket_path = argv[index + 1]
+            argv = argv[:index] + argv[index + 2:]
+            break
+        elif arg.startswith('--connect='):
+            socket_path = arg[len('--connect='):]
+            argv = argv[:index] + argv[index + 1:]
+            break
+    if socket_path and vxWireguardCommand._find_subcommand(argv) != 'serve':
+        from api import client
+        sys.exit(client.vw_connect(socket_path, argv))
     test = vxWireguardCommand()
-    test.parser_sub_command()
+    sys.exit(test.parser_sub_command(argv))